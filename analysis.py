@@ -0,0 +1,142 @@
+import heapq
+import queue
+import threading
+import chess
+import chess.engine
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from cache import get_default_cache
+from engine import EnginePool
+from profiling import logger
+
+
+class ReanalysisScheduler:
+    # Deepens the evals of a tree a few plies at a time, positions that are reached often and searched shallowly go first
+    def __init__(self, opening_tree, engine_pool=None, cpu_budget=600, depth_step=2, max_depth=30, growth=1.5):
+        self.opening_tree = opening_tree
+        self.owns_engine_pool = engine_pool is None
+        self.engine_pool = engine_pool or EnginePool(cache=get_default_cache())
+        self.cpu_budget = cpu_budget
+        self.depth_step = depth_step
+        self.max_depth = max_depth
+        # Every extra ply costs roughly this factor more engine time
+        self.growth = growth
+
+        self.cpu_time = 0.0
+        self.analysed = 0
+        self.results = queue.Queue()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def get_reach_probabilities(self):
+        # Chance to reach every position from the root when moves are played with their relative frequency, summed over transpositions.
+        # Only the nodes that exist are visited, a lazy tree is not expanded for this. Keying them also indexes them for apply_updates
+        tree = self.opening_tree
+        reach = {}
+        probabilities = {}
+        for node, _, _, _ in tree.preorder(tree.game, loaded_only=True):
+            probability = probabilities[node.parent] * tree.get_node_statistics(node).frequency / 100 if node.parent else 1.0
+            probabilities[node] = probability
+            key = tree.get_node_key(node)
+            reach[key] = reach.get(key, 0.0) + probability
+        return reach
+
+    def get_eval_depth(self, key):
+        return max(self.opening_tree.get_node_statistics(node).evaldepth for node in self.opening_tree.position_index[key])
+
+    def get_priority(self, reach, depth):
+        return reach / self.growth ** depth
+
+    def build_queue(self):
+        heap = []
+        for key, reach in self.get_reach_probabilities().items():
+            depth = self.get_eval_depth(key)
+            if depth < self.max_depth:
+                heap.append((-self.get_priority(reach, depth), key, reach, depth))
+        heapq.heapify(heap)
+        return heap
+
+    def analyse(self, key, depth):
+        # Only the search itself counts against the budget, not waiting for an idle engine
+        eval, search_time = self.engine_pool.analyse_timed(chess.Board(key), chess.engine.Limit(depth=depth))
+        return eval, search_time * self.engine_pool.threads
+
+    def run(self, apply_updates=True):
+        heap = self.build_queue()
+        logger.info(f"Re-analysing {len(heap)} positions with a budget of {self.cpu_budget} CPU seconds")
+
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.engine_pool.size, thread_name_prefix="reanalysis") as executor:
+            while heap or pending:
+                # Keep every engine busy with the most important positions until the budget is spent
+                while heap and len(pending) < self.engine_pool.size and self.cpu_time < self.cpu_budget and not self.stop_event.is_set():
+                    _, key, reach, depth = heapq.heappop(heap)
+                    target_depth = min(depth + self.depth_step, self.max_depth)
+                    pending[executor.submit(self.analyse, key, target_depth)] = (key, reach, depth)
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, reach, previous_depth = pending.pop(future)
+                    eval, cpu_time = future.result()
+                    self.cpu_time += cpu_time
+                    self.analysed += 1
+                    self.results.put((key, eval))
+
+                    # Iterative deepening: the position competes again at its new depth, mates are final.
+                    # A cached or depth-capped answer that got no deeper would only come back the same, so the position is done
+                    score, depth = eval
+                    if previous_depth < depth < self.max_depth and not score.is_mate():
+                        heapq.heappush(heap, (-self.get_priority(reach, depth), key, reach, depth))
+
+                if apply_updates:
+                    self.apply_updates()
+
+        logger.info(f"Re-analysis done: {self.analysed} analyses, {self.cpu_time:.1f} CPU seconds")
+
+    def apply_updates(self):
+        # Write the deeper evals back into every node of the position, and into the shared position of a graph view
+        tree = self.opening_tree
+        updated = False
+        while True:
+            try:
+                key, eval = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            if tree.graph_root is not None:
+                position = tree.graph.get(key)
+                if position is not None and position.stats is not None and eval[1] > position.stats.evaldepth:
+                    tree.set_eval(position.stats, eval)
+            for node in tree.position_index.get(key, []):
+                stats = tree.get_node_statistics(node)
+                if eval[1] > stats.evaldepth:
+                    tree.set_eval(stats, eval)
+                    updated = True
+        if updated:
+            tree.invalidate_columns()
+        return updated
+
+    def start(self):
+        # Results wait in the queue until apply_updates is called, e.g. from the event loop of the display
+        self.thread = threading.Thread(target=self.run, kwargs={"apply_updates": False}, name="reanalysis", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.apply_updates()
+
+    def close(self):
+        self.stop()
+        if self.owns_engine_pool:
+            self.engine_pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
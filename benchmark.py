@@ -0,0 +1,454 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import chess
+import chess.engine
+import chess.pgn
+
+from engine import EnginePool
+from explorer import ExplorerClient
+from opening import OpeningTree
+from stats import NodeStats
+
+# Runs without network or Stockfish: the explorer is a local stub server and the engine a fake UCI process started from this file
+FAKE_ENGINE = [sys.executable, os.path.abspath(__file__), "--fake-engine"]
+
+
+def get_position_hash(fen):
+    # Move counters are left out so transpositions get the same answers
+    return int(hashlib.md5(" ".join(fen.split()[:4]).encode()).hexdigest(), 16)
+
+
+def get_stub_position_info(fen, breadth=6, games=1000000):
+    # Deterministic explorer answer, the game counts fall off with the ply like in a real database
+    board = chess.Board(fen)
+    position_hash = get_position_hash(fen)
+    base = games >> (2 * board.ply())
+    moves = []
+    for i, move in enumerate(sorted(board.legal_moves, key=lambda move: move.uci())[:breadth]):
+        occurrences = base // (i + 2) + (position_hash >> i) % 100
+        white = occurrences // 3
+        draws = occurrences // 3
+        moves.append({"uci": move.uci(), "white": white, "draws": draws, "black": occurrences - white - draws})
+
+    total = sum(move["white"] + move["draws"] + move["black"] for move in moves) + 7
+    opening = {"eco": "A00", "name": f"Stub opening {position_hash % 7}"} if position_hash % 3 == 0 else None
+    return {"white": total // 3, "draws": total // 3, "black": total - 2 * (total // 3), "moves": moves, "opening": opening}
+
+
+class StubExplorerServer:
+    def __init__(self, breadth=6, games=1000000, latency=0.0):
+        self.breadth = breadth
+        self.games = games
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes, without this every keep-alive request waits for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                fen = parse_qs(urlparse(self.path).query).get("fen", [chess.STARTING_FEN])[0]
+                with stub.lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                body = json.dumps(get_stub_position_info(fen, stub.breadth, stub.games)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/masters"
+        self.thread = threading.Thread(target=self.server.serve_forever, name="stub-explorer", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def run_fake_engine(delay=0.0):
+    # Minimal UCI engine: a made up score per position and the requested depth, optionally taking some time
+    position = ""
+    for line in sys.stdin:
+        command = line.strip()
+        if command == "uci":
+            print("id name Benchmark engine\noption name Threads type spin default 1 min 1 max 512\noption name Hash type spin default 16 min 1 max 33554432\nuciok", flush=True)
+        elif command == "isready":
+            print("readyok", flush=True)
+        elif command.startswith("position"):
+            position = get_command_board(command).fen()
+        elif command.startswith("go"):
+            arguments = command.split()
+            depth = int(arguments[arguments.index("depth") + 1]) if "depth" in arguments else 20
+            if delay:
+                time.sleep(delay)
+            # Like a real engine the score depends on the position, not on the moves leading to it
+            score = get_position_hash(position) % 201 - 100
+            print(f"info depth {depth} score cp {score} pv\nbestmove 0000", flush=True)
+        elif command == "quit":
+            break
+
+
+def get_command_board(command):
+    # "position startpos moves ..." or "position fen <fen> moves ..."
+    arguments = command.split()
+    if arguments[1] == "startpos":
+        board, moves = chess.Board(), arguments[3:]
+    else:
+        board, moves = chess.Board(" ".join(arguments[2:8])), arguments[9:]
+    for move in moves:
+        board.push_uci(move)
+    return board
+
+
+def measure(function, repeat=5):
+    # Wall clock of each run, the result of the last run is returned along with the summary
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return summarize(times), result
+
+
+def summarize(times):
+    times = sorted(times)
+    return {
+        "runs": len(times),
+        "min": times[0],
+        "median": times[len(times) // 2],
+        "mean": sum(times) / len(times),
+        "p95": times[min(len(times) - 1, int(len(times) * 0.95))],
+        "max": times[-1]
+    }
+
+
+def make_synthetic_tree(depth, breadth, seed=0):
+    # Random legal lines with made up but consistent statistics, every node has up to breadth children
+    rng = random.Random(seed)
+    opening_tree = OpeningTree()
+    root_stats = make_synthetic_stats(rng, 10 ** 7, 100)
+    opening_tree.node_stats[opening_tree.game] = root_stats
+
+    stack = [(opening_tree.game, opening_tree.game.board(), root_stats, 0)]
+    while stack:
+        node, board, stats, node_depth = stack.pop()
+        if node_depth >= depth:
+            continue
+        moves = list(board.legal_moves)
+        rng.shuffle(moves)
+        moves = moves[:breadth]
+        weights = [rng.random() + 0.1 for _ in moves]
+        for move, weight in zip(moves, weights):
+            frequency = round(weight / sum(weights) * 100, 2)
+            child_stats = make_synthetic_stats(rng, max(1, int(stats.total_occurrence * frequency / 100)), frequency)
+            if not child_stats.has_opening:
+                child_stats.eco, child_stats.openingname = stats.eco, stats.openingname
+            child_node = node.add_variation(move)
+            opening_tree.node_stats[child_node] = child_stats
+            child_board = board.copy(stack=False)
+            child_board.push(move)
+            stack.append((child_node, child_board, child_stats, node_depth + 1))
+    opening_tree.index_positions()
+    return opening_tree
+
+
+def make_synthetic_stats(rng, total_occurrence, frequency):
+    stats = NodeStats(total_occurrence=total_occurrence, frequency=frequency)
+    stats.white_wins = int(total_occurrence * rng.uniform(0.25, 0.45))
+    stats.black_wins = int(total_occurrence * rng.uniform(0.2, 0.35))
+    stats.draws = total_occurrence - stats.white_wins - stats.black_wins
+    stats.white_percentage = round(stats.white_wins / total_occurrence * 100, 2)
+    stats.draw_percentage = round(stats.draws / total_occurrence * 100, 2)
+    stats.black_percentage = round(stats.black_wins / total_occurrence * 100, 2)
+    stats.eval = round(rng.uniform(-1.5, 1.5), 2)
+    stats.evaldepth = rng.randint(16, 30)
+    if rng.random() < 0.05:
+        stats.eco = f"{rng.choice('ABCDE')}{rng.randint(0, 99):02d}"
+        stats.openingname = f"Synthetic opening {rng.randint(0, 999)}"
+        stats.has_opening = True
+    return stats
+
+
+def get_nodes(opening_tree):
+    return [node for node, _, _, _ in opening_tree.preorder(opening_tree.game)]
+
+
+def benchmark_pgn(filename, repeat, directory):
+    def load():
+        opening_tree = OpeningTree()
+        opening_tree.load_opening_tree(filename)
+        return opening_tree
+
+    load_times, opening_tree = measure(load, repeat)
+    saved_file = os.path.join(directory, "saved.pgn")
+    save_times, _ = measure(lambda: opening_tree.save_opening_tree(saved_file), repeat)
+    nodes = len(get_nodes(opening_tree))
+    return {
+        "file": filename,
+        "bytes": os.path.getsize(filename),
+        "nodes": nodes,
+        "load": load_times,
+        "save": save_times,
+        "load_nodes_per_second": nodes / load_times["median"],
+        "save_nodes_per_second": nodes / save_times["median"]
+    }, opening_tree
+
+
+def benchmark_queries(opening_tree, repeat):
+    nodes = get_nodes(opening_tree)
+
+    def cold():
+        # Every comment is parsed again, like a tree whose statistics were never indexed
+        opening_tree.node_stats = {}
+        for node in nodes:
+            opening_tree.get_node_information(node)
+
+    def warm():
+        for node in nodes:
+            opening_tree.get_node_information(node)
+
+    cold_times, _ = measure(cold, repeat)
+    warm_times, _ = measure(warm, repeat)
+    size_times, size = measure(lambda: opening_tree.get_size(opening_tree.game), repeat)
+    return {
+        "nodes": len(nodes),
+        "get_node_information_cold": cold_times,
+        "get_node_information_warm": warm_times,
+        "cold_nodes_per_second": len(nodes) / cold_times["median"],
+        "warm_nodes_per_second": len(nodes) / warm_times["median"],
+        "get_size": size_times,
+        "get_size_nodes_per_second": size["nodes_amount"] / size_times["median"]
+    }
+
+
+def benchmark_build(url, min_occurrences, repeat, engine_delay):
+    results = {}
+    fake_engine = FAKE_ENGINE + (["--engine-delay", str(engine_delay)] if engine_delay else [])
+    with EnginePool(engine_path=fake_engine, cache=None) as engine_pool:
+        for name in ("depth_first", "breadth_first"):
+            requests = []
+
+            def build():
+                opening_tree = OpeningTree()
+                with ExplorerClient(rate=10 ** 6, burst=10 ** 6, cache=None) as explorer:
+                    if name == "depth_first":
+                        opening_tree.build_opening_tree(url, min_occurrences=min_occurrences, engine_time=0.01, engine_pool=engine_pool, explorer=explorer)
+                    else:
+                        opening_tree.build_opening_tree_breadth_first(url, min_occurrences=min_occurrences, engine_time=0.01, engine_pool=engine_pool, explorer=explorer)
+                    requests.append(explorer.get_stats()["requests"])
+                return opening_tree
+
+            times, opening_tree = measure(build, repeat)
+
+            # Every edge into a position that was already reached is a transposition
+            positions = len(opening_tree.graph)
+            edges = sum(len(position.edges) for position in opening_tree.graph.positions.values())
+            results[name] = {
+                "build": times,
+                "positions": positions,
+                "edges": edges,
+                "transpositions": edges - positions + 1,
+                "requests": requests[-1],
+                "positions_per_second": positions / times["median"],
+                "profile": opening_tree.build_profile.to_dict()
+            }
+    return results
+
+
+def benchmark_display(opening_tree, frames, width, height):
+    # Draw into a hidden window, the GPU is waited for after every frame so the timings include the rendering
+    os.environ.setdefault("ARCADE_HEADLESS", "1")
+    from display import Display
+
+    opening_tree.current_node = opening_tree.game
+    window = Display(opening_tree, width, height)
+    try:
+        def draw():
+            window.on_draw()
+            window.ctx.finish()
+
+        first_frame, _ = measure(draw, 1)
+        steady_frames, _ = measure(draw, frames)
+
+        # Hovering moves over the rings, only the highlight overlay changes
+        center_x, center_y = (width / 2) // 2, height // 2
+        radius = width / 5
+        points = [(center_x + radius * (i % 10 + 1) / 11, center_y + (i % 7) - 3) for i in range(frames)]
+
+        def hover():
+            x, y = points[hover.index % len(points)]
+            hover.index += 1
+            window.on_mouse_motion(x, y, 0, 0)
+            draw()
+        hover.index = 0
+        hover_frames, _ = measure(hover, frames)
+
+        # Every step to another node rebuilds the sunburst and the board
+        path = [opening_tree.game]
+        while path[-1].variations and len(path) < frames:
+            path.append(path[-1].variations[0])
+
+        def navigate():
+            opening_tree.current_node = path[navigate.index % len(path)]
+            navigate.index += 1
+            draw()
+        navigate.index = 0
+        navigate_frames, _ = measure(navigate, frames)
+    finally:
+        window.close()
+        opening_tree.current_node = opening_tree.game
+
+    return {
+        "width": width,
+        "height": height,
+        "first_frame": first_frame,
+        "steady": steady_frames,
+        "hover": hover_frames,
+        "navigate": navigate_frames,
+        "steady_fps": 1 / steady_frames["median"]
+    }
+
+
+def run_benchmarks(pgn_file="Trees/masters_10000.pgn", synthetic=((6, 4), (8, 3)), min_occurrences=1000, repeat=3, frames=60, width=1300, height=700, display=True, engine_delay=0.0, explorer_latency=0.0):
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "chess": chess.__version__,
+        "commit": get_commit(),
+        "settings": {"pgn_file": pgn_file, "synthetic": [list(shape) for shape in synthetic], "min_occurrences": min_occurrences, "repeat": repeat, "frames": frames, "engine_delay": engine_delay, "explorer_latency": explorer_latency},
+        "pgn": {},
+        "queries": {}
+    }
+
+    directory = tempfile.mkdtemp(prefix="opening-benchmark-")
+    try:
+        trees = []
+        if pgn_file and os.path.exists(pgn_file):
+            trees.append((os.path.basename(pgn_file), pgn_file))
+        for depth, breadth in synthetic:
+            name = f"synthetic_{depth}x{breadth}"
+            filename = os.path.join(directory, name + ".pgn")
+            make_synthetic_tree(depth, breadth).save_opening_tree(filename)
+            trees.append((name, filename))
+
+        display_tree = None
+        for name, filename in trees:
+            print(f"Benchmarking {name}")
+            results["pgn"][name], opening_tree = benchmark_pgn(filename, repeat, directory)
+            results["queries"][name] = benchmark_queries(opening_tree, repeat)
+            if display_tree is None:
+                display_tree = opening_tree
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print("Benchmarking build")
+    with StubExplorerServer(latency=explorer_latency) as server:
+        results["build"] = benchmark_build(server.url, min_occurrences, repeat, engine_delay)
+
+    if display and display_tree is not None:
+        print("Benchmarking display")
+        try:
+            results["display"] = benchmark_display(display_tree, frames, width, height)
+        except Exception as exception:
+            # No OpenGL context available, the other results are still worth keeping
+            results["display"] = {"error": f"{type(exception).__name__}: {exception}"}
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare_results(baseline, results, path=""):
+    # Ratio of every median and throughput to the baseline, > 1 means slower for timings and faster for throughput
+    comparison = {}
+    for key, value in results.items():
+        if key not in baseline or key in ("settings",):
+            continue
+        if isinstance(value, dict):
+            if "median" in value and "median" in baseline[key]:
+                comparison[path + key] = value["median"] / baseline[key]["median"] if baseline[key]["median"] else None
+            else:
+                comparison.update(compare_results(baseline[key], value, path + key + "."))
+        elif key.endswith("per_second") or key.endswith("fps"):
+            comparison[path + key] = value / baseline[key] if baseline[key] else None
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loading, saving, querying, building and drawing opening trees")
+    parser.add_argument("--pgn", default="Trees/masters_10000.pgn")
+    parser.add_argument("--synthetic", nargs="*", default=["6x4", "8x3"], help="synthetic trees as DEPTHxBREADTH")
+    parser.add_argument("--min-occurrences", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--width", type=int, default=1300)
+    parser.add_argument("--height", type=int, default=700)
+    parser.add_argument("--no-display", action="store_true")
+    parser.add_argument("--engine-delay", type=float, default=0.0, help="seconds the fake engine takes per analysis")
+    parser.add_argument("--explorer-latency", type=float, default=0.0, help="seconds the stub explorer takes per request")
+    parser.add_argument("--output", default=None, help="JSON file for the results, printed when not given")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--fake-engine", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.fake_engine:
+        run_fake_engine(arguments.engine_delay)
+        return
+
+    synthetic = [tuple(int(value) for value in shape.split("x")) for shape in arguments.synthetic]
+    results = run_benchmarks(arguments.pgn, synthetic, arguments.min_occurrences, arguments.repeat, arguments.frames, arguments.width, arguments.height, not arguments.no_display, arguments.engine_delay, arguments.explorer_latency)
+
+    if arguments.compare:
+        with open(arguments.compare, "r") as file:
+            results["comparison"] = compare_results(json.load(file), results)
+        for key, ratio in sorted(results["comparison"].items()):
+            if ratio is not None:
+                print(f"{key}: {ratio:.2f}x")
+
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {arguments.output}")
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+import chess
+import chess.pgn
+
+from positions import LazyChildNode, LazyGame
+from stats import NodeStats, format_comment
+
+BINARY_EXTENSION = ".tree"
+MAGIC = b"OETREE"
+VERSION = 1
+HEADER = struct.Struct("<6sHIIIH")
+NO_STRING = 0xFFFFFFFF
+NO_EVAL = -2 ** 31
+# Mate scores are stored beyond any centipawn score
+MATE_SCORE = 100000000
+
+# Fixed width columns, one value per node or per edge. Percentages and frequencies are stored in hundredths
+NODE_COLUMNS = [
+    ("total_occurrence", "Q"),
+    ("white_wins", "Q"),
+    ("draws", "Q"),
+    ("black_wins", "Q"),
+    ("eval", "i"),
+    ("evaldepth", "H"),
+    ("white_percentage", "H"),
+    ("draw_percentage", "H"),
+    ("black_percentage", "H"),
+    ("eco", "I"),
+    ("openingname", "I"),
+    ("first_edge", "I"),
+    ("edge_count", "H")
+]
+EDGE_COLUMNS = [
+    ("move", "H"),
+    ("target", "I"),
+    ("frequency", "H")
+]
+
+
+class TreeFile:
+    def __init__(self, filename):
+        check_byteorder()
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.views = [memoryview(self.mmap)]
+
+        magic, version, node_count, edge_count, string_count, root_frequency = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{filename} is not a version {VERSION} opening tree file")
+        self.node_count = node_count
+        self.edge_count = edge_count
+        self.root_frequency = root_frequency / 100
+
+        offset = align(HEADER.size)
+        self.nodes = {}
+        for name, code in NODE_COLUMNS:
+            self.nodes[name], offset = self.map_column(offset, code, node_count)
+        self.edges = {}
+        for name, code in EDGE_COLUMNS:
+            self.edges[name], offset = self.map_column(offset, code, edge_count)
+        self.string_offsets, offset = self.map_column(offset, "I", string_count + 1)
+        self.string_data = offset
+        self.strings = {}
+        self.node_stats = None
+
+    def map_column(self, offset, code, count):
+        size = struct.calcsize(code) * count
+        column = self.views[0][offset:offset + size].cast(code)
+        self.views.append(column)
+        return column, align(offset + size)
+
+    def get_string(self, index):
+        if index == NO_STRING:
+            return ""
+        string = self.strings.get(index)
+        if string is None:
+            start = self.string_data + self.string_offsets[index]
+            end = self.string_data + self.string_offsets[index + 1]
+            string = self.mmap[start:end].decode("utf-8")
+            self.strings[index] = string
+        return string
+
+    def get_stats(self, index, frequency, parent_stats=None):
+        nodes = self.nodes
+        stats = NodeStats(frequency=frequency)
+        if nodes["eco"][index] != NO_STRING:
+            stats.eco = self.get_string(nodes["eco"][index])
+            stats.openingname = self.get_string(nodes["openingname"][index])
+            stats.has_opening = True
+        elif parent_stats is not None and parent_stats.eco:
+            stats.eco = parent_stats.eco
+            stats.openingname = parent_stats.openingname
+
+        stats.total_occurrence = nodes["total_occurrence"][index]
+        stats.white_wins = nodes["white_wins"][index]
+        stats.draws = nodes["draws"][index]
+        stats.black_wins = nodes["black_wins"][index]
+        stats.white_percentage = nodes["white_percentage"][index] / 100
+        stats.draw_percentage = nodes["draw_percentage"][index] / 100
+        stats.black_percentage = nodes["black_percentage"][index] / 100
+        stats.eval, stats.mate = decode_eval(nodes["eval"][index])
+        if stats.eval is not None or stats.mate is not None:
+            stats.evaldepth = nodes["evaldepth"][index]
+        return stats
+
+    def load_game(self, node_stats=None):
+        # Statistics of every created node are added to node_stats instead of a comment, so comments never have to be parsed
+        self.node_stats = node_stats
+        game = LazyGame()
+        stats = self.get_stats(0, self.root_frequency)
+        if node_stats is not None:
+            node_stats[game] = stats
+        else:
+            # Without an index of the statistics the comments are the only place to keep them
+            game.comment = format_comment(stats, root=True)
+        self.set_lazy(game, 0)
+        return game
+
+    def expand(self, node, index):
+        parent_stats = self.node_stats.get(node) if self.node_stats is not None else None
+        first_edge = self.nodes["first_edge"][index]
+        for edge in range(first_edge, first_edge + self.nodes["edge_count"][index]):
+            target = self.edges["target"][edge]
+            stats = self.get_stats(target, self.edges["frequency"][edge] / 100, parent_stats)
+            child_node = LazyChildNode(node, decode_move(self.edges["move"][edge]))
+            if self.node_stats is not None:
+                self.node_stats[child_node] = stats
+            else:
+                child_node.comment = format_comment(stats)
+            self.set_lazy(child_node, target)
+
+    def get_edges(self, index):
+        first_edge = self.nodes["first_edge"][index]
+        return [(decode_move(self.edges["move"][edge]), self.edges["target"][edge]) for edge in range(first_edge, first_edge + self.nodes["edge_count"][index])]
+
+    def set_lazy(self, node, index):
+        if self.nodes["edge_count"][index]:
+            node._tree_index = index
+            node._tree_source = self
+
+    def close(self):
+        # Views have to be released before the mapping can be closed
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.mmap.close()
+        self.file.close()
+
+
+def save_binary_tree(root, frequency, filename):
+    # Writes the position graph below root, positions reached by several move orders are stored once
+    check_byteorder()
+    nodes = {name: array(code) for name, code in NODE_COLUMNS}
+    edges = {name: array(code) for name, code in EDGE_COLUMNS}
+    strings = {}
+
+    def intern(string):
+        if string not in strings:
+            strings[string] = len(strings)
+        return strings[string]
+
+    # Breadth-first order keeps the edges of every position next to each other
+    queue = [root]
+    indices = {root: 0}
+    for position in queue:
+        nodes["first_edge"].append(len(edges["move"]))
+        nodes["edge_count"].append(len(position.edges))
+        for edge in position.edges:
+            if edge.target not in indices:
+                indices[edge.target] = len(queue)
+                queue.append(edge.target)
+            edges["move"].append(encode_move(edge.move))
+            edges["target"].append(indices[edge.target])
+            edges["frequency"].append(round(edge.frequency * 100))
+
+        stats = position.stats or NodeStats()
+        nodes["total_occurrence"].append(stats.total_occurrence)
+        nodes["white_wins"].append(stats.white_wins)
+        nodes["draws"].append(stats.draws)
+        nodes["black_wins"].append(stats.black_wins)
+        nodes["white_percentage"].append(round(stats.white_percentage * 100))
+        nodes["draw_percentage"].append(round(stats.draw_percentage * 100))
+        nodes["black_percentage"].append(round(stats.black_percentage * 100))
+        nodes["eval"].append(encode_eval(stats))
+        nodes["evaldepth"].append(stats.evaldepth)
+        nodes["eco"].append(intern(stats.eco) if stats.has_opening else NO_STRING)
+        nodes["openingname"].append(intern(stats.openingname) if stats.has_opening else NO_STRING)
+
+    encoded_strings = [string.encode("utf-8") for string in strings]
+    string_offsets = array("I", [0])
+    for encoded_string in encoded_strings:
+        string_offsets.append(string_offsets[-1] + len(encoded_string))
+
+    header = HEADER.pack(MAGIC, VERSION, len(queue), len(edges["move"]), len(strings), round(frequency * 100))
+    sections = [nodes[name] for name, _ in NODE_COLUMNS] + [edges[name] for name, _ in EDGE_COLUMNS] + [string_offsets]
+
+    # Write next to the old file first so a failed save never destroys it
+    temporary_filename = filename + ".tmp"
+    with open(temporary_filename, 'wb') as file:
+        write_aligned(file, header)
+        for section in sections:
+            write_aligned(file, section.tobytes())
+        file.write(b"".join(encoded_strings))
+    os.replace(temporary_filename, filename)
+
+
+def write_aligned(file, data):
+    file.write(data)
+    file.write(b"\0" * (align(len(data)) - len(data)))
+
+
+def align(offset):
+    return (offset + 7) // 8 * 8
+
+
+def encode_eval(stats):
+    if stats.eval is not None:
+        return round(stats.eval * 100)
+    if stats.mate is not None:
+        return MATE_SCORE + stats.mate if stats.mate > 0 else -MATE_SCORE + stats.mate
+    return NO_EVAL
+
+
+def decode_eval(value):
+    if value == NO_EVAL:
+        return None, None
+    if value > MATE_SCORE // 2:
+        return None, value - MATE_SCORE
+    if value < -MATE_SCORE // 2:
+        return None, value + MATE_SCORE
+    return value / 100, None
+
+
+def encode_move(move):
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(code):
+    return chess.Move(code & 63, code >> 6 & 63, code >> 12 or None)
+
+
+def check_byteorder():
+    if sys.byteorder != "little":
+        raise ValueError("Binary opening trees are only supported on little-endian machines")
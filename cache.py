@@ -0,0 +1,133 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import chess
+import chess.engine
+
+import config
+
+
+class ResultCache:
+    def __init__(self, filename=config.CACHE_PATH, explorer_ttl=config.EXPLORER_CACHE_TTL, eval_ttl=config.EVAL_CACHE_TTL, max_entries=config.CACHE_MAX_ENTRIES):
+        self.filename = filename
+        self.ttls = {"explorer": explorer_ttl, "evals": eval_ttl}
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+        self.writes_since_eviction = 0
+
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS explorer (key TEXT PRIMARY KEY, value TEXT, created REAL)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS evals (key TEXT PRIMARY KEY, score TEXT, depth INTEGER, created REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS explorer_created ON explorer (created)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS evals_created ON evals (created)")
+        self.connection.commit()
+        self.evict()
+
+    def get_position_info(self, fen, url, params=None):
+        row = self.get("explorer", get_explorer_key(fen, url, params), "value")
+        return json.loads(row[0]) if row else None
+
+    def set_position_info(self, fen, url, position_info, params=None):
+        self.set("explorer", get_explorer_key(fen, url, params), ("value",), (json.dumps(position_info),))
+
+    def get_eval(self, board, limit):
+        row = self.get("evals", get_eval_key(board, limit), "score, depth")
+        return (load_score(row[0], board.turn), row[1]) if row else None
+
+    def set_eval(self, board, limit, eval):
+        self.set("evals", get_eval_key(board, limit), ("score", "depth"), (dump_score(eval[0]), eval[1]))
+
+    def get(self, table, key, columns):
+        query = f"SELECT {columns} FROM {table} WHERE key = ?"
+        arguments = [key]
+        if self.ttls[table] is not None:
+            query += " AND created >= ?"
+            arguments.append(time.time() - self.ttls[table])
+
+        with self.lock:
+            row = self.connection.execute(query, arguments).fetchone()
+            self.stats["hits" if row else "misses"] += 1
+        return row
+
+    def set(self, table, key, columns, values):
+        placeholders = ", ".join("?" for _ in range(len(columns) + 2))
+        with self.lock:
+            self.connection.execute(f"INSERT OR REPLACE INTO {table} (key, {', '.join(columns)}, created) VALUES ({placeholders})", (key, *values, time.time()))
+            self.connection.commit()
+            self.stats["writes"] += 1
+            self.writes_since_eviction += 1
+            evict = self.writes_since_eviction >= 10000
+        if evict:
+            self.evict()
+
+    def evict(self):
+        with self.lock:
+            for table, ttl in self.ttls.items():
+                # Drop expired entries first, then the oldest ones above the size limit
+                if ttl is not None:
+                    self.connection.execute(f"DELETE FROM {table} WHERE created < ?", (time.time() - ttl,))
+                if self.max_entries is not None:
+                    self.connection.execute(f"DELETE FROM {table} WHERE key IN (SELECT key FROM {table} ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            self.connection.commit()
+            self.writes_since_eviction = 0
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def normalize_fen(fen):
+    # Move counters and impossible en passant squares do not change the position
+    return chess.Board(fen).epd(en_passant="legal")
+
+
+def get_explorer_key(fen, url, params=None):
+    params = "&".join(f"{name}={value}" for name, value in sorted((params or {}).items()))
+    return f"{url}?{params}|{normalize_fen(fen)}"
+
+
+def get_eval_key(board, limit):
+    return f"time={limit.time},depth={limit.depth},nodes={limit.nodes}|{board.epd(en_passant='legal')}"
+
+
+def dump_score(score):
+    relative = score.relative
+    if relative == chess.engine.MateGiven:
+        return "mategiven"
+    if relative.is_mate():
+        return f"mate {relative.mate()}"
+    return f"cp {relative.score()}"
+
+
+def load_score(text, turn):
+    if text == "mategiven":
+        return chess.engine.PovScore(chess.engine.MateGiven, turn)
+    kind, value = text.split()
+    score = chess.engine.Mate(int(value)) if kind == "mate" else chess.engine.Cp(int(value))
+    return chess.engine.PovScore(score, turn)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    global _default_cache
+    if config.CACHE_PATH is None:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
@@ -0,0 +1,166 @@
+import chess
+import numpy as np
+
+from binary_tree import decode_move, encode_move
+
+# Mates are kept in the eval column as huge scores, a shorter mate ranks higher
+MATE_EVAL = 1000.0
+
+
+class TreeColumns:
+    def __init__(self, nodes, parent, move, depth, occurrences, frequency, white_wins, draws, black_wins, eval, eval_depth, root_turn=chess.WHITE):
+        # Nodes in breadth-first order, so every parent comes before its children and siblings are contiguous
+        self.nodes = nodes
+        self.parent = parent
+        self.move = move
+        self.depth = depth
+        self.occurrences = occurrences
+        self.frequency = frequency
+        self.white_wins = white_wins
+        self.draws = draws
+        self.black_wins = black_wins
+        self.eval = eval
+        self.eval_depth = eval_depth
+        self.root_turn = root_turn
+
+        # The children of node i are the rows child_start[i] up to child_start[i] + child_count[i]
+        self.child_count = np.bincount(parent[1:], minlength=len(nodes)).astype(np.int32)
+        self.child_start = (np.searchsorted(parent[1:], np.arange(len(nodes))) + 1).astype(np.int32)
+        self.index = None
+        self._reach = None
+        self._white_score = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def reach(self):
+        # Chance of reaching each node from the root when both sides play the moves as often as in the games, level by level
+        if self._reach is None:
+            reach = np.ones(len(self.nodes))
+            share = self.frequency / 100
+            for level in range(1, int(self.depth.max(initial=0)) + 1):
+                rows = np.flatnonzero(self.depth == level)
+                reach[rows] = reach[self.parent[rows]] * share[rows]
+            self._reach = reach
+        return self._reach
+
+    @property
+    def white_score(self):
+        if self._white_score is None:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                self._white_score = (self.white_wins + 0.5 * self.draws) / self.occurrences
+        return self._white_score
+
+    @property
+    def black_score(self):
+        return 1 - self.white_score
+
+    @property
+    def turn(self):
+        # Side to move in each position
+        return (self.depth % 2 == 0) == self.root_turn
+
+    def get_expected_score(self, color):
+        return self.white_score if color == chess.WHITE else self.black_score
+
+    def get_node_index(self, node):
+        if self.index is None:
+            self.index = {node: index for index, node in enumerate(self.nodes)}
+        return self.index.get(node)
+
+    def get_children(self, index):
+        start = self.child_start[index]
+        return np.arange(start, start + self.child_count[index])
+
+    def get_ordered_children(self, index, values, reverse=True):
+        # Stable like list.sort, unknown values go last either way
+        children = self.get_children(index)
+        values = values[children]
+        order = np.argsort(-values if reverse else values, kind="stable")
+        return children[order]
+
+    def get_best_child(self, index, values):
+        children = self.get_ordered_children(index, values)
+        return children[0] if len(children) else None
+
+    def filter(self, min_reach=None, min_occurrences=None, min_depth=None, max_depth=None, turn=None, evaluated=False):
+        mask = np.ones(len(self.nodes), dtype=bool)
+        if min_reach is not None:
+            mask &= self.reach >= min_reach
+        if min_occurrences is not None:
+            mask &= self.occurrences >= min_occurrences
+        if min_depth is not None:
+            mask &= self.depth >= min_depth
+        if max_depth is not None:
+            mask &= self.depth <= max_depth
+        if turn is not None:
+            mask &= self.turn == turn
+        if evaluated:
+            mask &= ~np.isnan(self.eval)
+        return mask
+
+    def top_k(self, values, k, mask=None):
+        # Rows of the k largest values, best first, skipping unknown values and rows outside the mask
+        candidates = ~np.isnan(values)
+        if mask is not None:
+            candidates &= mask
+        rows = np.flatnonzero(candidates)
+        if len(rows) > k:
+            rows = rows[np.argpartition(-values[rows], k - 1)[:k]]
+        return rows[np.argsort(-values[rows], kind="stable")]
+
+    def get_moves(self, index):
+        # The moves from the root of the export to the node
+        moves = []
+        while index > 0:
+            moves.append(decode_move(int(self.move[index])))
+            index = self.parent[index]
+        return moves[::-1]
+
+    def get_san(self, index, board=None):
+        board = board.copy(stack=False) if board is not None else self.nodes[0].board()
+        return board.variation_san(self.get_moves(index))
+
+
+def export_columns(opening_tree, node=None, max_depth=None, loaded_only=False):
+    if node is None:
+        node = opening_tree.game
+
+    nodes = []
+    rows = {}
+    parent = []
+    move = []
+    depth = []
+    statistics = []
+    for child_node, child_depth, _, _ in opening_tree.breadth_first(node, max_depth=max_depth, loaded_only=loaded_only):
+        rows[child_node] = len(nodes)
+        nodes.append(child_node)
+        parent.append(rows[child_node.parent] if child_depth else -1)
+        move.append(encode_move(child_node.move) if child_depth else 0)
+        depth.append(child_depth)
+        statistics.append(opening_tree.get_node_statistics(child_node))
+
+    eval = np.array([get_eval(stats) for stats in statistics], dtype=np.float64)
+    return TreeColumns(
+        nodes,
+        np.array(parent, dtype=np.int32),
+        np.array(move, dtype=np.uint16),
+        np.array(depth, dtype=np.int16),
+        np.array([stats.total_occurrence for stats in statistics], dtype=np.int64),
+        np.array([stats.frequency for stats in statistics], dtype=np.float64),
+        np.array([stats.white_wins for stats in statistics], dtype=np.int64),
+        np.array([stats.draws for stats in statistics], dtype=np.int64),
+        np.array([stats.black_wins for stats in statistics], dtype=np.int64),
+        eval,
+        np.array([stats.evaldepth if stats.eval is not None or stats.mate is not None else 0 for stats in statistics], dtype=np.int16),
+        node.turn()
+    )
+
+
+def get_eval(stats):
+    if stats.eval is not None:
+        return stats.eval
+    if stats.mate is not None:
+        return MATE_EVAL - stats.mate if stats.mate > 0 else -MATE_EVAL - stats.mate
+    return np.nan
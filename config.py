@@ -0,0 +1,23 @@
+import os
+
+# Engine settings
+ENGINE_PATH = os.environ.get("STOCKFISH_PATH", "stockfish.exe")
+ENGINE_POOL_SIZE = 4
+ENGINE_THREADS = 1
+ENGINE_HASH = 64
+
+# Opening explorer settings
+EXPLORER_URL = "https://explorer.lichess.ovh/masters"
+EXPLORER_RATE = 4.0
+EXPLORER_BURST = 4
+EXPLORER_CONCURRENCY = 8
+EXPLORER_TIMEOUT = 30
+EXPLORER_MAX_RETRIES = 8
+EXPLORER_BACKOFF = 2.0
+EXPLORER_MAX_BACKOFF = 120.0
+
+# Result cache settings, set CACHE_PATH to None to disable the cache
+CACHE_PATH = "Cache/results.sqlite"
+EXPLORER_CACHE_TTL = 30 * 24 * 60 * 60
+EVAL_CACHE_TTL = None
+CACHE_MAX_ENTRIES = 1000000
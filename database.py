@@ -0,0 +1,209 @@
+import io
+import os
+import chess
+import chess.pgn
+import chess.polyglot
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from pgn_tree import HEADER_REGEX
+from profiling import logger
+
+RESULTS = {"1-0": 0, "1/2-1/2": 1, "0-1": 2}
+
+
+class DatabaseExplorer:
+    # Serves position info aggregated from PGN files in the shape of the opening explorer, so the normal builders can use it
+    concurrency = 1
+
+    def __init__(self, positions, opening_share=0.9):
+        self.positions = positions
+        self.opening_share = opening_share
+        self.requests = 0
+
+    def get_position_info(self, fen, url=None):
+        self.requests += 1
+        record = self.positions.get(get_position_key(chess.Board(fen)))
+        if record is None:
+            return {"white": 0, "draws": 0, "black": 0, "moves": []}
+
+        white, draws, black, moves, openings = record
+        moves = sorted(moves.items(), key=lambda item: (-sum(item[1]), item[0]))
+        return {
+            "white": white,
+            "draws": draws,
+            "black": black,
+            "moves": [{"uci": uci, "white": counts[0], "draws": counts[1], "black": counts[2]} for uci, counts in moves],
+            "opening": self.get_opening(openings)
+        }
+
+    def get_opening(self, openings):
+        # The deepest opening name level shared by most games through the position, e.g. "Sicilian Defense" after 1.e4 c5
+        labelled = sum(openings.values())
+        if not labelled:
+            return None
+        levels = Counter()
+        for (eco, name), count in openings.items():
+            for level in get_name_levels(name):
+                levels[level] += count
+        shared = [level for level, count in levels.items() if count >= self.opening_share * labelled]
+        if not shared:
+            return None
+
+        name = max(shared, key=len)
+        ecos = Counter()
+        for (eco, opening_name), count in openings.items():
+            if opening_name.startswith(name):
+                ecos[eco] += count
+        return {"eco": ecos.most_common(1)[0][0], "name": name}
+
+    def get_stats(self):
+        return {"requests": self.requests, "positions": len(self.positions)}
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_name_levels(name):
+    # "Sicilian Defense: Najdorf Variation, English Attack" is nested three levels deep
+    levels = []
+    family, _, variations = name.partition(": ")
+    levels.append(family)
+    if variations:
+        level = family + ": "
+        for index, variation in enumerate(variations.split(", ")):
+            level += (", " if index else "") + variation
+            levels.append(level)
+    return levels
+
+
+def read_pgn_database(filenames, max_ply=20, min_occurrences=0, processes=None, games_per_chunk=1000):
+    # Games are streamed to a process pool in chunks, every worker returns the counts of its chunk which are merged here
+    if isinstance(filenames, str):
+        filenames = [filenames]
+    processes = processes or os.cpu_count()
+
+    positions = {}
+    games = 0
+    pending = set()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for chunk in read_game_chunks(filenames, games_per_chunk):
+            # Only a few chunks are in flight so memory does not grow with the size of the database
+            if len(pending) >= 2 * processes:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    games += merge_counts(positions, *future.result())
+                logger.info(f"{games} games counted, {len(positions)} positions")
+            pending.add(executor.submit(count_games, chunk, max_ply))
+
+        for future in pending:
+            games += merge_counts(positions, *future.result())
+    logger.info(f"{games} games counted, {len(positions)} positions")
+
+    if min_occurrences:
+        prune_counts(positions, min_occurrences)
+    return DatabaseExplorer(positions)
+
+
+def read_game_chunks(filenames, games_per_chunk):
+    # Split on the tag pairs of the next game without parsing anything, parsing happens in the workers.
+    # Lines of the moves can start with "[" too, e.g. a comment continued with [%eval ...], those do not start a game
+    for filename in filenames:
+        with open(filename, 'r', encoding="utf-8-sig", errors="replace") as file:
+            lines = []
+            games = 0
+            in_moves = False
+            for line in file:
+                if line.startswith("[") and HEADER_REGEX.match(line.strip()):
+                    if in_moves:
+                        games += 1
+                        in_moves = False
+                        if games >= games_per_chunk:
+                            yield "".join(lines)
+                            lines = []
+                            games = 0
+                elif line.strip():
+                    in_moves = True
+                lines.append(line)
+            if lines:
+                yield "".join(lines)
+
+
+def count_games(pgn_text, max_ply):
+    positions = {}
+    games = 0
+    handle = io.StringIO(pgn_text)
+    while True:
+        game = chess.pgn.read_game(handle)
+        if game is None:
+            break
+        result = RESULTS.get(game.headers.get("Result"))
+        if result is None:
+            continue
+        games += 1
+        opening = (game.headers.get("ECO", ""), game.headers.get("Opening", ""))
+
+        board = game.board()
+        record = add_game(positions, get_position_key(board), result, opening)
+        for ply, move in enumerate(game.mainline_moves()):
+            if ply >= max_ply:
+                break
+            move_counts = record[3].get(move.uci())
+            if move_counts is None:
+                move_counts = record[3][move.uci()] = [0, 0, 0]
+            move_counts[result] += 1
+
+            board.push(move)
+            record = add_game(positions, get_position_key(board), result, opening)
+    return positions, games
+
+
+def get_position_key(board):
+    # The ply keeps repetitions apart like the full FEN keys of the position graph, otherwise a repeated position would expand forever
+    return chess.polyglot.zobrist_hash(board), board.ply()
+
+
+def add_game(positions, key, result, opening):
+    # A record is [white, draws, black, {uci: [white, draws, black]}, Counter({(eco, name): games})]
+    record = positions.get(key)
+    if record is None:
+        record = positions[key] = [0, 0, 0, {}, Counter()]
+    record[result] += 1
+    if opening[1]:
+        record[4][opening] += 1
+    return record
+
+
+def merge_counts(positions, shard, games):
+    for key, shard_record in shard.items():
+        record = positions.get(key)
+        if record is None:
+            positions[key] = shard_record
+            continue
+        for result in range(3):
+            record[result] += shard_record[result]
+        for uci, shard_counts in shard_record[3].items():
+            counts = record[3].get(uci)
+            if counts is None:
+                record[3][uci] = shard_counts
+            else:
+                for result in range(3):
+                    counts[result] += shard_counts[result]
+        record[4].update(shard_record[4])
+    return games
+
+
+def prune_counts(positions, min_occurrences):
+    # Positions and moves below the threshold can never be expanded, only the starting position is kept regardless
+    root_key = get_position_key(chess.Board())
+    for key in [key for key, record in positions.items() if sum(record[:3]) < min_occurrences and key != root_key]:
+        del positions[key]
+    for record in positions.values():
+        for uci in [uci for uci, counts in record[3].items() if sum(counts) < min_occurrences]:
+            del record[3][uci]
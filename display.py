@@ -1,14 +1,36 @@
 import arcade
-import sys
 import math
 import chess
-from opening import OpeningTree  # Import your OpeningTree class from the opening module
+import numpy as np
+import pyglet
+from arcade.gl import BufferDescription
+from bisect import bisect_right
+
+PIECE_SYMBOLS = "PNBRQK"
+# Seconds the repertoire of an older tree is still used while the tree grows, so it is not rebuilt for every expanded leaf
+REPERTOIRE_MAX_AGE = 2.0
+BACKGROUND_COLOR = (25, 81, 85)
+
+
+class Segment:
+    __slots__ = ("node", "key", "depth", "start_angle", "end_angle", "color", "text", "text_x", "text_y")
+
+    def __init__(self, node, key, depth, start_angle, end_angle, color, text, text_x, text_y):
+        self.node = node
+        self.key = key
+        self.depth = depth
+        self.start_angle = start_angle
+        self.end_angle = end_angle
+        self.color = color
+        self.text = text
+        self.text_x = text_x
+        self.text_y = text_y
 
 
 class Display(arcade.Window):
-    def __init__(self, opening_tree, width, height):
+    def __init__(self, opening_tree, width, height, max_depth=6, expander=None, analyser=None):
         super().__init__(width, height, "Chess Opening Explorer")
-        arcade.set_background_color((25, 81, 85))
+        arcade.set_background_color(BACKGROUND_COLOR)
         self.width = width
         self.height = height
         self.x = 0
@@ -18,47 +40,72 @@ class Display(arcade.Window):
         self.pov = "White"
         self.current_mode = "Frequency"
         self.current_arrows = "All"
+        self.max_depth = max_depth
         self.opening_tree = opening_tree
+        # Optional LiveExpander filling in leaves while browsing
+        self.expander = expander
+        # Optional ReanalysisScheduler deepening evals in the background
+        self.analyser = analyser
+
+        # Sunburst layout for the current root, flat and per ring for hit-testing
+        self.segments = []
+        self.rings = []
+        self.segments_by_key = {}
+        self.sunburst_layout = None
+
+        # Batches for the cached layout, the highlight overlay only changes with the hovered segment
+        self.sunburst_shape = None
+        self.highlight_shape = None
+        self.highlight = None
+        self.text_batch = pyglet.graphics.Batch()
+        self.text_labels = []
+
+        # Board batches, rebuilt only when the window size, position or point of view changes
+        self.piece_textures = load_piece_textures()
+        self.square_list = None
+        self.piece_list = arcade.SpriteList()
+        self.board_layout = None
+        self.board_position = None
+
+        # The scene is drawn into an offscreen frame only after input or a tree change, other frames copy it to the screen
+        self.frame = None
+        self.dirty = True
 
     def on_draw(self):
-        self.clear()
-        self.show_board()
-        self.show_opening_graph(max_depth=6)
-        self.show_current_node_info()
-        self.show_buttons()
+        size = self.get_framebuffer_size()
+        if self.frame is None or self.frame.size != size:
+            self.frame = self.ctx.framebuffer(color_attachments=[self.ctx.texture(size, components=4)])
+            self.dirty = True
+
+        if self.dirty:
+            self.dirty = False
+            with self.frame.activate():
+                self.frame.clear(BACKGROUND_COLOR)
+                self.show_board()
+                self.show_opening_graph(max_depth=self.max_depth)
+                self.show_current_node_info()
+                self.show_buttons()
+        self.ctx.copy_framebuffer(self.frame, self.ctx.screen)
 
     def show_board(self):
         board_size = self.width / 2.5
         center_x, center_y = (3 * self.width / 2) // 2, self.height // 2
 
-        # Create a chess board instance
-        board = chess.Board(self.opening_tree.current_node.board().fen())
-
-        # Draw the chess board
         square_size = board_size / 8
-        for row in range(8):
-            for col in range(8):
-                if self.pov == "White":
-                    square_x = center_x - (board_size / 2) + col * square_size
-                    square_y = center_y - (board_size / 2) + (7 - row) * square_size
-                else:
-                    square_x = center_x - (board_size / 2) + (7 - col) * square_size
-                    square_y = center_y - (board_size / 2) + row * square_size
+        layout = (self.width, self.height)
+        if layout != self.board_layout:
+            self.square_list = self.build_square_list(center_x, center_y, board_size)
+            self.board_layout = layout
+            self.board_position = None
 
-                # Draw board
-                if (row + col) % 2 == 0:
-                    arcade.draw_rectangle_filled(square_x + square_size / 2, square_y + square_size / 2, square_size, square_size, (240, 226, 188))
-                else:
-                    arcade.draw_rectangle_filled(square_x + square_size / 2, square_y + square_size / 2, square_size, square_size, (52, 52, 44))
+        position = (self.opening_tree.get_node_key(self.opening_tree.current_node), self.pov)
+        if position != self.board_position:
+            self.piece_list = self.build_piece_list(chess.Board(position[0]), center_x, center_y, board_size)
+            self.board_position = position
 
-                # Draw pieces
-                piece = board.piece_at(chess.square(col, 7 - row))
-                if piece:
-                    piece_symbol = piece.symbol().upper()
-                    piece_color = "w" if piece.color == chess.WHITE else "b"
-                    image_path = f"Images/{piece_color}{piece_symbol}.png"
-                    texture = arcade.load_texture(image_path)
-                    arcade.draw_texture_rectangle(square_x + square_size / 2, square_y + square_size / 2, square_size, square_size, texture)
+        # Draw board and pieces
+        self.square_list.draw()
+        self.piece_list.draw()
 
         if self.current_segment and self.current_arrows != "None":
             node = self.current_segment
@@ -93,25 +140,24 @@ class Display(arcade.Window):
                     arcade.draw_line_strip([(start_x, start_y), (end_x, end_y), (arrowhead1_x, arrowhead1_y), (end_x, end_y), (arrowhead2_x, arrowhead2_y)], arrow_color, line_width=15)
                     node = node.parent
         elif self.current_arrows != "None":
-            # Draw arrows
-            child_nodes = self.opening_tree.current_node.variations
-
-            # Sort child nodes based on frequency or evaluation, depending on current_mode setting
+            # Draw arrows, the children are ordered from the columns of the current node without reordering the tree
+            # Sort child nodes based on frequency or, looked up from the repertoire of the side to move, on their value with best play below them
             if self.current_mode == "Frequency":
-                child_nodes.sort(key=lambda node: self.opening_tree.get_node_information(node)["frequency"], reverse=True)
+                columns = self.opening_tree.get_columns(self.opening_tree.current_node, max_depth=1)
+                child_rows = columns.get_ordered_children(0, columns.frequency)
             else:
-                child_nodes.sort(key=lambda node: self.opening_tree.get_node_information(node)["eval"], reverse=True)
+                repertoire = self.opening_tree.get_repertoire(self.opening_tree.current_node.turn(), max_age=REPERTOIRE_MAX_AGE, node=self.opening_tree.current_node, loaded_only=True)
+                columns = repertoire.columns
+                child_rows = repertoire.get_ordered_children(columns.get_node_index(self.opening_tree.current_node))
 
             # Take the top 1 or 3 nodes, depending on current_arrows setting
-            if self.current_arrows == "All":
-                nodes_to_draw = child_nodes
-            elif self.current_arrows == "1":
-                nodes_to_draw = child_nodes[:1]
+            if self.current_arrows == "1":
+                child_rows = child_rows[:1]
             elif self.current_arrows == "3":
-                nodes_to_draw = child_nodes[:3]
+                child_rows = child_rows[:3]
 
-            for child_node in nodes_to_draw:
-                child_info = self.opening_tree.get_node_information(child_node)
+            for row in child_rows:
+                child_node = columns.nodes[row]
                 move_from = child_node.move.uci()[:2]  # Extract the starting square from UCI notation
                 move_to = child_node.move.uci()[2:]  # Extract the ending square from UCI notation
 
@@ -126,10 +172,12 @@ class Display(arcade.Window):
                     start_y, end_y = self.height - start_y, self.height - end_y
 
                 if self.current_mode == "Frequency":
-                    color_value = child_info["frequency"] * 2.55
+                    color_value = columns.frequency[row] * 2.55
                     arrow_color = (int(color_value), int(color_value), int(color_value))
                 else:
-                    color_value = max(0, min(255, (1 / (1 + math.exp(-5 * child_info["eval"]))) * 255))
+                    # Mates are stored as evals of almost 1000 pawns, far past where the curve is flat
+                    eval = np.clip(columns.eval[row], -10, 10)
+                    color_value = max(0, min(255, (1 / (1 + math.exp(-5 * eval))) * 255))
                     arrow_color = (int(color_value), int(color_value), int(color_value))
 
                 # Calculate arrowhead points
@@ -143,68 +191,167 @@ class Display(arcade.Window):
                 # Draw the arrow
                 arcade.draw_line_strip([(start_x, start_y), (end_x, end_y), (arrowhead1_x, arrowhead1_y), (end_x, end_y), (arrowhead2_x, arrowhead2_y)], arrow_color, line_width=15)
 
-    def show_opening_graph(self, _start_angle=0, _end_angle=360, max_depth=3, cur_depth=1):
-        if cur_depth > max_depth:
+    def get_square_center(self, square, center_x, center_y, board_size):
+        square_size = board_size / 8
+        col, row = chess.square_file(square), chess.square_rank(square)
+        if self.pov != "White":
+            col, row = 7 - col, 7 - row
+        square_x = center_x - (board_size / 2) + col * square_size
+        square_y = center_y - (board_size / 2) + row * square_size
+        return square_x + square_size / 2, square_y + square_size / 2
+
+    def build_square_list(self, center_x, center_y, board_size):
+        square_size = board_size / 8
+        square_list = arcade.ShapeElementList()
+        for square in chess.SQUARES:
+            square_x, square_y = self.get_square_center(square, center_x, center_y, board_size)
+            if (chess.square_file(square) + chess.square_rank(square)) % 2 == 1:
+                color = (240, 226, 188)
+            else:
+                color = (52, 52, 44)
+            square_list.append(arcade.create_rectangle_filled(square_x, square_y, square_size, square_size, color))
+        return square_list
+
+    def build_piece_list(self, board, center_x, center_y, board_size):
+        square_size = board_size / 8
+        piece_list = arcade.SpriteList()
+        for square, piece in board.piece_map().items():
+            piece_color = "w" if piece.color == chess.WHITE else "b"
+            texture = self.piece_textures[f"{piece_color}{piece.symbol().upper()}"]
+            square_x, square_y = self.get_square_center(square, center_x, center_y, board_size)
+            sprite = arcade.Sprite(texture=texture, center_x=square_x, center_y=square_y)
+            sprite.width = square_size
+            sprite.height = square_size
+            piece_list.append(sprite)
+        return piece_list
+
+    def show_opening_graph(self, max_depth=3):
+        self.update_sunburst(max_depth)
+        self.update_highlight()
+
+        if self.sunburst_shape is not None:
+            self.sunburst_shape.draw()
+        if self.highlight_shape is not None:
+            self.highlight_shape.draw()
+        with self.ctx.pyglet_rendering():
+            self.text_batch.draw()
+
+    def update_sunburst(self, max_depth):
+        layout = (self.opening_tree.current_node, self.current_mode, self.width, self.height, max_depth)
+        if layout != self.sunburst_layout:
+            self.sunburst_layout = layout
+            self.build_sunburst(max_depth)
+            # The segments moved, so the node under the mouse is looked up again instead of keeping the one hovered before
+            self.current_segment = self.get_hovered_node()
+
+    def invalidate_sunburst(self):
+        self.sunburst_layout = None
+        self.dirty = True
+
+    def update_highlight(self):
+        highlight = (self.current_segment, self.sunburst_layout)
+        if highlight == self.highlight:
             return
 
-        max_width = self.width / 5
-        # Draw the sunburst diagram
+        segments = []
+        colors = []
+        if self.current_segment is not None:
+            # The hovered segment and every transposition of it in the diagram
+            for segment in self.segments_by_key.get(self.opening_tree.get_node_key(self.current_segment), []):
+                segments.append(segment)
+                colors.append((20, 200, 20) if segment.node is self.current_segment else (50, 250, 50))
+        self.highlight_shape = self.create_sunburst_shape(segments, colors)
+        self.highlight = highlight
+
+    def create_sunburst_shape(self, segments, colors):
+        if not segments:
+            return None
         center_x, center_y = (self.width/2) // 2, self.height // 2
-        width = max_width/max_depth
-        cumulative_angle = _start_angle
-        child_nodes = self.opening_tree.current_node.variations
-        for child_node in child_nodes:
-            self.opening_tree.current_node = child_node
-            child_info = self.opening_tree.get_node_information()
-            self.opening_tree.current_node = child_node.parent
+        width = (self.width / 5) / self.sunburst_layout[-1]
+
+        depths = np.array([segment.depth for segment in segments], dtype=np.float64)
+        start_angles = np.array([segment.start_angle for segment in segments], dtype=np.float64)
+        end_angles = np.array([segment.end_angle for segment in segments], dtype=np.float64)
+        points, vertex_colors = get_arc_vertices(center_x, center_y, start_angles, end_angles, (depths - 1) * width, depths * width, colors)
+        return create_triangle_shape(points, vertex_colors)
+
+    def build_sunburst(self, max_depth):
+        center_x, center_y = (self.width/2) // 2, self.height // 2
+        width = (self.width / 5) / max_depth
+        segments = []
+        rings = [([], []) for _ in range(max_depth)]
+
+        # Breadth first so every ring comes out sorted by angle. Segments are drawn as rings, not pie slices, so their order does not matter.
+        # Every drawn node keeps its angle range and the angle where its next child starts, the others are not descended into
+        root = self.opening_tree.current_node
+        ranges = {root: [0, 360, 0]}
+        boards = {}
+        for child_node, cur_depth, _, _ in self.opening_tree.breadth_first(root, max_depth=max_depth, prune=lambda node, depth: node not in ranges):
+            if cur_depth == 0:
+                continue
+            child_info = self.opening_tree.get_node_information(child_node)
 
             # Calculate segment properties
-            end_angle = cumulative_angle + (_end_angle - _start_angle) * (child_info["frequency"] / 100) 
+            _start_angle, _end_angle, cumulative_angle = ranges[child_node.parent]
+            end_angle = cumulative_angle + (_end_angle - _start_angle) * (child_info["frequency"] / 100)
+            ranges[child_node.parent][2] = end_angle
             if (end_angle - cumulative_angle) > 1:
-                self.opening_tree.current_node = child_node
-                self.show_opening_graph(_start_angle=cumulative_angle, _end_angle=end_angle, max_depth=max_depth, cur_depth=cur_depth + 1)
-                self.opening_tree.current_node = child_node.parent
+                board = boards.get(child_node.parent)
+                if board is None:
+                    board = boards[child_node.parent] = chess.Board(self.opening_tree.get_node_key(child_node.parent))
 
                 # Calculate color based on white wins percentage
-                if child_node is not self.current_segment:
-                    if (self.current_segment is not None) and (child_node.board().fen() == self.current_segment.board().fen()):
-                        color = (50, 250, 50)
-                    elif self.current_mode == "Frequency":
-                        win_percentage = child_info["white_wins"] / (child_info["white_wins"] + child_info["black_wins"])
-                        color_value = (1 / (1 + math.exp(-15 * (win_percentage - 0.5)))) * 255
-                        color = (int(color_value), int(color_value), int(color_value))
-                    else:
-                        color_value = max(0, min(255, (1 / (1 + math.exp(-3 * child_info["eval"]))) * 255))
-                        color = (int(color_value), int(color_value), int(color_value))
+                if self.current_mode == "Frequency":
+                    win_percentage = child_info["white_wins"] / (child_info["white_wins"] + child_info["black_wins"])
+                    color_value = (1 / (1 + math.exp(-15 * (win_percentage - 0.5)))) * 255
                 else:
-                    color = (20, 200, 20)
+                    color_value = max(0, min(255, (1 / (1 + math.exp(-3 * child_info["eval"]))) * 255))
+                color = (int(color_value), int(color_value), int(color_value))
 
-                # Draw the pie segment with black outline
-                arcade.draw_arc_filled(center_x, center_y, 2 * cur_depth * width, 2 * cur_depth * width, color, cumulative_angle, end_angle)
-                
                 # Add information text
                 text_x = center_x + width * (cur_depth-0.5) * math.cos(math.radians((cumulative_angle + end_angle)/2))
                 text_y = center_y + width * (cur_depth-0.5) * math.sin(math.radians((cumulative_angle + end_angle)/2))
-                move_text = f"{child_node.parent.board().san(child_node.move)}"
 
-                # Display text
-                arcade.draw_text(move_text, text_x, text_y, arcade.color.BLACK, font_size=10, anchor_x="center", anchor_y="center")
+                segment = Segment(child_node, self.opening_tree.get_node_key(child_node), cur_depth, cumulative_angle, end_angle, color, board.san(child_node.move), text_x, text_y)
+                segments.append(segment)
+                rings[cur_depth - 1][0].append(cumulative_angle)
+                rings[cur_depth - 1][1].append(segment)
+                ranges[child_node] = [cumulative_angle, end_angle, cumulative_angle]
 
-                
-                mouse_dist = math.sqrt((self.x - center_x) ** 2 + (self.y - center_y) ** 2)
-                # Check if the mouse is over the sunburst diagram
-                if mouse_dist <= max_depth * width:
-                    mouse_angle = math.atan2(self.y - center_y, self.x - center_x)  # atan2 handles all quadrants
-                    mouse_angle = (math.degrees(mouse_angle)) % 360  # Convert radians to degrees and adjust range to [0, 360)
+        self.segments = segments
+        self.rings = rings
+        self.segments_by_key = {}
+        for segment in segments:
+            self.segments_by_key.setdefault(segment.key, []).append(segment)
 
-                    # Check if mouse is over the current segment
-                    if (cumulative_angle <= mouse_angle <= end_angle) and ((cur_depth - 1) * width < mouse_dist < cur_depth * width):
-                        self.current_segment = child_node
-                else:
-                    self.current_segment = None
+        self.sunburst_shape = self.create_sunburst_shape(segments, [segment.color for segment in segments])
+        self.text_batch = pyglet.graphics.Batch()
+        self.text_labels = [pyglet.text.Label(segment.text, x=segment.text_x, y=segment.text_y, font_name=("calibri", "arial"), font_size=10, color=(0, 0, 0, 255), anchor_x="center", anchor_y="center", batch=self.text_batch) for segment in segments]
 
-            # Update cumulative angle for the next segment
-            cumulative_angle = end_angle
+    def get_segment_at(self, x, y):
+        center_x, center_y = (self.width/2) // 2, self.height // 2
+        width = (self.width / 5) / self.max_depth
+        self.update_sunburst(self.max_depth)
+
+        mouse_dist = math.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
+        ring = int(mouse_dist // width)
+        if ring >= len(self.rings):
+            return None
+        mouse_angle = math.atan2(y - center_y, x - center_x)  # atan2 handles all quadrants
+        mouse_angle = (math.degrees(mouse_angle)) % 360  # Convert radians to degrees and adjust range to [0, 360)
+
+        start_angles, segments = self.rings[ring]
+        index = bisect_right(start_angles, mouse_angle) - 1
+        if index >= 0 and mouse_angle <= segments[index].end_angle:
+            return segments[index]
+        return None
+
+    def get_hovered_node(self):
+        center_x, center_y = (self.width/2) // 2, self.height // 2
+        if math.sqrt((self.x - center_x) ** 2 + (self.y - center_y) ** 2) > self.width / 5:
+            return None
+        segment = self.get_segment_at(self.x, self.y)
+        return segment.node if segment is not None else None
 
     def show_current_node_info(self):
         if self.current_segment:
@@ -234,7 +381,8 @@ class Display(arcade.Window):
         eval_text = f"Eval: {eval}\nDepth: {eval_depth}"
         arcade.draw_text(eval_text, 10, self.height - 50, arcade.color.WHITE, font_size=12, anchor_x="left", anchor_y="top")
 
-    def show_buttons(self):
+    def get_buttons(self):
+        # Labels and centers of the buttons along the bottom, with the size they all share
         if self.current_mode == "Frequency":
             next_text = "Next (most common)"
             colors_text = "Mode: Frequency"
@@ -245,36 +393,61 @@ class Display(arcade.Window):
         button_labels = [colors_text, arrows_text, "Start", "Previous", next_text, "Flip"]
         button_width = (self.width + 20) / len(button_labels)
         button_height = 40
+        return [(label, (2 * i + 1) * button_width / 2, 20) for i, label in enumerate(button_labels)], button_width, button_height
 
-        
-        for i, label in enumerate(button_labels):
-            button_x = (2 * i + 1) * button_width / 2
-            button_y = 20
-
-            # Determine button color based on mouse hover
-            button_color = arcade.color.LIGHT_GRAY
-            if (button_y - button_height / 2 <= self.y <= button_y + button_height / 2):
-                if (button_x - button_width / 2 <= self.x <= button_x + button_width / 2):
-                    button_color = arcade.color.GRAY
-                    self.current_button = label
-            else:
-                self.current_button = None
-            # Draw buttons
+    def get_button_at(self, x, y):
+        buttons, button_width, button_height = self.get_buttons()
+        for label, button_x, button_y in buttons:
+            if abs(x - button_x) <= button_width / 2 and abs(y - button_y) <= button_height / 2:
+                return label
+        return None
+
+    def show_buttons(self):
+        buttons, button_width, button_height = self.get_buttons()
+        for label, button_x, button_y in buttons:
+            # The hovered button was found by on_mouse_motion
+            button_color = arcade.color.GRAY if label == self.current_button else arcade.color.LIGHT_GRAY
             arcade.draw_rectangle_filled(button_x, button_y, button_width, button_height, button_color)
             arcade.draw_text(label, button_x, button_y, arcade.color.BLACK, font_size=12, anchor_x="center", anchor_y="center")
 
 
+    def on_update(self, delta_time):
+        if self.analyser is not None and self.analyser.apply_updates():
+            self.invalidate_sunburst()
+
+        if self.expander is None:
+            return
+
+        # Ask for the children of the current leaf or the hovered thin branch, and insert what has arrived
+        self.expander.request(self.opening_tree.current_node)
+        self.expander.request(self.current_segment, thin=True)
+        if self.expander.apply_updates():
+            self.invalidate_sunburst()
+
     def on_mouse_motion(self, x, y, dx, dy):
-        # Redraw to update hovered node information
+        # Only hit-test here, the next frame is drawn again if the hovered node or button changed
         self.x = x 
         self.y = y 
-        self.on_draw()
+        hovered = (self.current_segment, self.current_button)
+
+        center_x, center_y = (self.width/2) // 2, self.height // 2
+        if math.sqrt((x - center_x) ** 2 + (y - center_y) ** 2) <= self.width / 5:
+            segment = self.get_segment_at(x, y)
+            if segment is not None:
+                self.current_segment = segment.node
+        else:
+            self.current_segment = None
+        self.current_button = self.get_button_at(x, y)
+
+        if (self.current_segment, self.current_button) != hovered:
+            self.dirty = True
 
     def on_key_press(self, symbol, modifiers):
         if symbol == arcade.key.ESCAPE:
             arcade.close_window()
         
     def on_mouse_press(self, x, y, button, modifiers):
+        self.dirty = True
         if button == arcade.MOUSE_BUTTON_LEFT and self.current_segment:
             self.opening_tree.current_node = self.current_segment
         if button == arcade.MOUSE_BUTTON_LEFT and self.current_button:
@@ -301,13 +474,64 @@ class Display(arcade.Window):
                 if self.opening_tree.current_node.parent:
                     self.opening_tree.current_node = self.opening_tree.current_node.parent
             if "Next" in self.current_button and not self.opening_tree.current_node.is_end():
-                is_white_turn = self.opening_tree.current_node.turn() == chess.WHITE
-
-                key_function = lambda node: self.opening_tree.get_node_information(node)["eval"] * (1 if is_white_turn else -1)
-                self.opening_tree.current_node.variations.sort(key=key_function, reverse=True)
-                self.opening_tree.current_node = self.opening_tree.current_node.variations[0]
+                if self.current_mode == "Frequency":
+                    self.opening_tree.current_node = self.opening_tree.get_most_common_child()
+                else:
+                    # The best move of the side to move was found for the whole tree at once
+                    self.opening_tree.current_node = self.opening_tree.get_best_child(max_age=REPERTOIRE_MAX_AGE)
             if self.current_button == "Flip":
                 if self.pov == "White":
                     self.pov = "Black"
                 else:
                     self.pov = "White"
+            # The labels change with the mode and arrows
+            self.current_button = self.get_button_at(x, y)
+
+
+def load_piece_textures():
+    textures = {}
+    for piece_color in ("w", "b"):
+        for piece_symbol in PIECE_SYMBOLS:
+            textures[f"{piece_color}{piece_symbol}"] = arcade.load_texture(f"Images/{piece_color}{piece_symbol}.png")
+    return textures
+
+
+def get_arc_vertices(center_x, center_y, start_angles, end_angles, inner_radii, outer_radii, colors, num_segments=128):
+    # Every arc becomes a strip of quads between its inner and outer radius, generated for all arcs at once
+    start_angles = np.radians(start_angles)
+    spans = np.radians(end_angles) - start_angles
+    counts = np.maximum(1, np.ceil(spans / (2 * np.pi) * num_segments)).astype(np.int64)
+    arc = np.repeat(np.arange(len(counts)), counts)
+    step = np.arange(len(arc)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    theta0 = start_angles[arc] + spans[arc] * step / counts[arc]
+    theta1 = start_angles[arc] + spans[arc] * (step + 1) / counts[arc]
+    inner, outer = inner_radii[arc], outer_radii[arc]
+
+    # Two triangles per quad
+    angles = np.stack([theta0, theta0, theta1, theta0, theta1, theta1], axis=1).ravel()
+    radii = np.stack([inner, outer, outer, inner, outer, inner], axis=1).ravel()
+    points = np.empty((len(angles), 2), dtype=np.float32)
+    points[:, 0] = center_x + radii * np.cos(angles)
+    points[:, 1] = center_y + radii * np.sin(angles)
+
+    arc_colors = np.full((len(counts), 4), 255, dtype=np.uint8)
+    arc_colors[:, :3] = colors
+    vertex_colors = np.repeat(arc_colors[arc], 6, axis=0)
+    return points, vertex_colors
+
+
+def create_triangle_shape(points, colors):
+    # Same vertex layout as arcade's buffered shapes, packed with NumPy instead of vertex by vertex
+    ctx = arcade.get_window().ctx
+    data = np.empty(len(points), dtype=[("vert", np.float32, 2), ("color", np.uint8, 4)])
+    data["vert"] = points
+    data["color"] = colors
+    vbo = ctx.buffer(data=data.tobytes())
+
+    shape = arcade.Shape()
+    shape.vao = ctx.geometry([BufferDescription(vbo, "2f 4f1", ("in_vert", "in_color"), normalized=["in_color"])])
+    shape.vbo = vbo
+    shape.program = ctx.line_generic_with_colors_program
+    shape.mode = arcade.gl.TRIANGLES
+    return shape
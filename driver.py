@@ -1,9 +1,11 @@
 import arcade
+import logging
 import time
 from display import Display
+from live import LiveExpander
 from opening import OpeningTree
 
-def opening_explorer(filename, width, height):
+def opening_explorer(filename, width, height, live=False):
     start_time = time.time()  # Record the start time
     opening_tree = OpeningTree()
     opening_tree.load_opening_tree(filename)
@@ -13,10 +15,19 @@ def opening_explorer(filename, width, height):
     loading_time = end_time - start_time
     print(f"Opening tree loaded in {loading_time:.2f} seconds")
 
-    display = Display(opening_tree, width, height)
+    # In live mode leaves are expanded while browsing and the grown tree is written back to the file
+    expander = LiveExpander(opening_tree, save_file=filename) if live else None
+    display = Display(opening_tree, width, height, expander=expander)
     arcade.run()
+    if expander:
+        expander.close()
+
+# Progress of builds, refreshes, re-analysis and live expansion is logged
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
 
 """opening_tree = OpeningTree()
-opening_tree.build_opening_tree(min_occurrences=5000, engine_time=1)
-opening_tree.save_opening_tree("Trees/masters_5000.pgn")"""
+opening_tree.build_opening_tree_breadth_first(min_occurrences=5000, engine_time=1, checkpoint_file="Trees/masters_5000.checkpoint")
+# After a crash or Ctrl-C continue with: opening_tree.resume_opening_tree("Trees/masters_5000.checkpoint")
+opening_tree.save_opening_tree("Trees/masters_5000.pgn")
+opening_tree.build_profile.dump("Trees/masters_5000.profile.json")"""
 opening_explorer("Trees/masters_10000.pgn", 1300, 700)
@@ -0,0 +1,78 @@
+import queue
+import time
+import chess
+import chess.engine
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+
+class EnginePool:
+    def __init__(self, engine_path=config.ENGINE_PATH, size=config.ENGINE_POOL_SIZE, threads=config.ENGINE_THREADS, hash_size=config.ENGINE_HASH, cache=None):
+        self.engine_path = engine_path
+        self.size = size
+        self.threads = threads
+        self.cache = cache
+        self.engines = []
+        self.idle_engines = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="engine")
+
+        try:
+            for _ in range(size):
+                engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+                # Only set the options the engine actually supports
+                options = {"Threads": threads, "Hash": hash_size}
+                engine.configure({name: value for name, value in options.items() if name in engine.options})
+                self.engines.append(engine)
+                self.idle_engines.put(engine)
+        except Exception:
+            self.close()
+            raise
+
+    def analyse(self, board, limit):
+        return self.analyse_timed(board, limit)[0]
+
+    def analyse_timed(self, board, limit):
+        # Also returns how long the engine searched, waiting for an idle engine and cache hits take no engine time
+        if self.cache:
+            eval = self.cache.get_eval(board, limit)
+            if eval is not None:
+                return eval, 0.0
+
+        # Borrow an idle engine, blocks until one is available
+        engine = self.idle_engines.get()
+        try:
+            start = time.monotonic()
+            result = engine.analyse(board, limit)
+            search_time = time.monotonic() - start
+        finally:
+            self.idle_engines.put(engine)
+
+        eval = result["score"], result["depth"]
+        if self.cache:
+            self.cache.set_eval(board, limit, eval)
+        return eval, search_time
+
+    def submit(self, board, limit):
+        # Analyse in the background, the board is copied so the caller may keep using it.
+        # The moves are kept so the engine can tell repetitions
+        return self.executor.submit(self.analyse, board.copy(), limit)
+
+    def analyse_many(self, boards, limit):
+        futures = [self.submit(board, limit) for board in boards]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for engine in self.engines:
+            try:
+                engine.quit()
+            except chess.engine.EngineTerminatedError:
+                pass
+        self.engines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
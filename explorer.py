@@ -0,0 +1,194 @@
+import email.utils
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from cache import get_default_cache
+
+
+class ExplorerError(Exception):
+    pass
+
+
+class ExplorerConnectionError(ExplorerError):
+    pass
+
+
+class ExplorerHTTPError(ExplorerError):
+    def __init__(self, status_code, text):
+        super().__init__(f"Opening explorer returned {status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class ExplorerRateLimitError(ExplorerHTTPError):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity, min_rate=0.1):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Take a token, sleeping until one is available. Returns the time spent waiting
+        waited = 0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        # The server asked us to back off: hold every caller and halve the rate
+        with self.lock:
+            now = time.monotonic()
+            if now >= self.paused_until:
+                # Concurrent requests throttled by the same burst only slow down once
+                self.rate = max(self.min_rate, self.rate / 2)
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0
+
+    def reward(self):
+        # Slowly climb back to the configured rate after successful requests
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 0.05)
+
+
+class ExplorerClient:
+    def __init__(self, rate=config.EXPLORER_RATE, burst=config.EXPLORER_BURST, concurrency=config.EXPLORER_CONCURRENCY, timeout=config.EXPLORER_TIMEOUT, max_retries=config.EXPLORER_MAX_RETRIES, backoff=config.EXPLORER_BACKOFF, max_backoff=config.EXPLORER_MAX_BACKOFF, limiter=None, cache=None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limiter = limiter or TokenBucket(rate, burst)
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "retries": 0, "errors": 0, "wait_time": 0.0}
+
+    def get_position_info(self, fen, url=config.EXPLORER_URL):
+        if self.cache:
+            position_info = self.cache.get_position_info(fen, url)
+            if position_info is not None:
+                return position_info
+
+        params = {"fen": fen}
+        attempt = 0
+        while True:
+            self.count("wait_time", self.limiter.acquire())
+            self.count("requests")
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as exception:
+                error = ExplorerConnectionError(str(exception))
+                delay = self.get_backoff(attempt)
+            else:
+                if response.status_code == 200:
+                    self.limiter.reward()
+                    position_info = response.json()
+                    if self.cache:
+                        self.cache.set_position_info(fen, url, position_info)
+                    return position_info
+
+                if response.status_code == 429:
+                    self.count("throttled")
+                    error = ExplorerRateLimitError(response.status_code, response.text)
+                    delay = get_retry_after(response)
+                    if delay is None:
+                        delay = self.get_backoff(attempt)
+                    self.limiter.pause(delay)
+                elif response.status_code >= 500:
+                    error = ExplorerHTTPError(response.status_code, response.text)
+                    delay = self.get_backoff(attempt)
+                else:
+                    # Client errors will not go away by asking again
+                    self.count("errors")
+                    raise ExplorerHTTPError(response.status_code, response.text)
+
+            if attempt >= self.max_retries:
+                self.count("errors")
+                raise error
+
+            attempt += 1
+            self.count("retries")
+            if not isinstance(error, ExplorerRateLimitError):
+                # Rate limit pauses are waited out by the limiter
+                time.sleep(delay)
+                self.count("wait_time", delay)
+
+    def get_backoff(self, attempt):
+        # Exponential backoff with jitter so concurrent workers do not retry in lockstep
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    def count(self, name, amount=1):
+        with self.stats_lock:
+            self.stats[name] += amount
+
+    def get_stats(self):
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_retry_after(response):
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+
+    # Retry-After may also be an HTTP date
+    try:
+        retry_date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_date.timestamp() - time.time())
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = ExplorerClient(cache=get_default_cache())
+        return _default_client
+
+
+def get_position_info(fen, url=config.EXPLORER_URL, client=None):
+    return (client or get_default_client()).get_position_info(fen, url)
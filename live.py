@@ -0,0 +1,141 @@
+import queue
+import threading
+import time
+import chess
+import chess.engine
+
+import config
+from cache import get_default_cache
+from engine import EnginePool
+from explorer import ExplorerClient
+from profiling import logger
+
+
+class LiveExpander:
+    # Expands leaves of a browsed tree in a background worker, the tree itself is only changed by apply_updates and saved by a separate thread
+    def __init__(self, opening_tree, url=config.EXPLORER_URL, min_occurrences=None, engine_time=0.1, engine_pool=None, explorer=None, save_file=None, save_interval=60,
+                 thin_share=0.9, thin_min_occurrences=None, retry_interval=30):
+        self.opening_tree = opening_tree
+        self.url = url
+        # New leaves get the moves the tree was built with
+        self.min_occurrences = min_occurrences if min_occurrences is not None else opening_tree.get_min_occurrences()
+        # A branch is thin when its moves cover less than thin_share of the games, the missing rarer moves are fetched down to thin_min_occurrences
+        self.thin_share = thin_share
+        self.thin_min_occurrences = thin_min_occurrences if thin_min_occurrences is not None else max(1, self.min_occurrences // 10)
+        self.limit = chess.engine.Limit(time=engine_time)
+        self.save_file = save_file
+        self.save_interval = save_interval
+        self.retry_interval = retry_interval
+
+        self.owns_engine_pool = engine_pool is None
+        self.engine_pool = engine_pool or EnginePool(cache=get_default_cache())
+        self.owns_explorer = explorer is None
+        self.explorer = explorer or ExplorerClient(cache=get_default_cache())
+
+        self.requested = set()
+        # Nodes whose fetch failed, by the time they may be requested again
+        self.retry_after = {}
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.unsaved = False
+        self.last_save = time.monotonic()
+        # Held while the tree is written, the results wait in their queue until the save is done
+        self.tree_lock = threading.Lock()
+        self.saver = None
+        self.worker = threading.Thread(target=self.run, name="live-expander", daemon=True)
+        self.worker.start()
+
+    def request(self, node, thin=False):
+        # Leaves are expanded, and with thin also nodes missing many of their moves. Every node at most once unless the fetch failed
+        if node is None or node in self.requested or time.monotonic() < self.retry_after.get(node, 0):
+            return False
+        if not node.variations:
+            min_occurrences = self.min_occurrences
+        elif thin and self.is_thin(node):
+            min_occurrences = self.thin_min_occurrences
+        else:
+            return False
+        self.requested.add(node)
+        self.retry_after.pop(node, None)
+        known_moves = [variation.move for variation in node.variations]
+        self.requests.put((node, self.opening_tree.get_node_key(node), min_occurrences, known_moves))
+        return True
+
+    def is_thin(self, node):
+        covered = sum(self.opening_tree.get_node_statistics(variation).frequency for variation in node.variations)
+        return covered / 100 < self.thin_share
+
+    def run(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+            node, fen, min_occurrences, known_moves = item
+            try:
+                children = self.opening_tree.fetch_children(fen, self.url, min_occurrences, self.limit, self.engine_pool, self.explorer, known_moves)
+            except Exception as exception:
+                logger.warning(f"Could not expand {fen}, retrying in {self.retry_interval}s: {exception}")
+                children = None
+            self.results.put((node, children))
+
+    def apply_updates(self):
+        # Called from the event loop, so the tree is never changed while it is being drawn
+        if not self.tree_lock.acquire(blocking=False):
+            return False
+        updated = False
+        try:
+            while True:
+                try:
+                    node, children = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                if children is None:
+                    # The node may be requested again once the interval has passed
+                    self.requested.discard(node)
+                    self.retry_after[node] = time.monotonic() + self.retry_interval
+                elif self.opening_tree.add_children(node, children):
+                    updated = True
+                    self.unsaved = True
+        finally:
+            self.tree_lock.release()
+
+        if self.unsaved and self.save_file and time.monotonic() - self.last_save >= self.save_interval and not self.is_saving():
+            # Writing a large tree takes seconds, the event loop only starts it
+            self.saver = threading.Thread(target=self.save, name="live-saver", daemon=True)
+            self.saver.start()
+        return updated
+
+    def is_saving(self):
+        return self.saver is not None and self.saver.is_alive()
+
+    def save(self):
+        with self.tree_lock:
+            # A failed save is tried again after the interval
+            self.last_save = time.monotonic()
+            if self.save_file:
+                self.opening_tree.save_opening_tree(self.save_file)
+                logger.info(f"Expanded tree saved to {self.save_file}")
+            self.unsaved = False
+
+    def wait_for_save(self):
+        if self.saver is not None:
+            self.saver.join()
+
+    def close(self):
+        self.requests.put(None)
+        self.worker.join()
+        self.wait_for_save()
+        self.apply_updates()
+        self.wait_for_save()
+        if self.unsaved:
+            self.save()
+        if self.owns_engine_pool:
+            self.engine_pool.close()
+        if self.owns_explorer:
+            self.explorer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
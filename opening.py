@@ -1,168 +1,710 @@
-import requests
+import json
+import logging
+import os
 import time
-import copy
 import chess
+import chess.engine
 import chess.pgn
-import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from binary_tree import BINARY_EXTENSION, TreeFile, save_binary_tree
+from cache import get_default_cache
+from columns import export_columns
+from database import read_pgn_database
+from engine import EnginePool
+from explorer import ExplorerClient, get_default_client, get_position_info
+from pgn_tree import read_pgn_tree, write_game_tree, write_position_graph
+from positions import Edge, GraphView, PositionGraph, build_position_graph, find_position_paths, get_loaded_variations, get_position_key
+from profiling import BuildProfile, logger
+from repertoire import build_repertoire
+from stats import NodeStats, derive_stats, format_comment, parse_comment
 
 class OpeningTree:
     def __init__(self):
         self.game = chess.pgn.Game()
         self.current_node = self.game
-        self.memoization_dict = {}
+        self.graph = PositionGraph()
+        self.graph_root = None
+        self.graph_frequency = 100
+        self.node_stats = {}
+        self.node_keys = {}
+        self.position_index = {}
+        self.positions_indexed = False
+        self.tree_file = None
+        # Timers and counters of the last build
+        self.build_profile = None
+        # Columnar exports by (node, max_depth) and repertoires by (color, criterion), with the version of the tree and the time they were built
+        self.columns = {}
+        self.repertoires = {}
+        # Bumped whenever the tree or its statistics change, older exports are only reused by callers that accept stale ones
+        self.version = 0
 
     def get_node_information(self, node=None):
-        node_information = {}
-        original_node = self.current_node
-        if node:   
-            self.current_node = node
-        node_information = self.get_opening_details(node_information)
-        node_information = self.get_player_details(node_information)
-        node_information = self.get_engine_details(node_information)
-        self.current_node = original_node
-
-        return node_information
-    
-    def get_opening_details(self, node_information):
-        comment = self.current_node.comment
-        opening_match = re.search(r'\[open: (.*?), (.*?)\]', comment)
-
-        if opening_match:
-            node_information['eco'] = opening_match.group(1)
-            node_information['openingname'] = opening_match.group(2)
+        return self.get_node_statistics(node).to_dict()
+
+    def get_node_statistics(self, node=None):
+        if node is None:
+            node = self.current_node
+
+        stats = self.node_stats.get(node)
+        if stats is None:
+            # Parse the missing ancestors top-down so the opening name can be inherited
+            missing = []
+            while node is not None and node not in self.node_stats:
+                missing.append(node)
+                node = node.parent
+
+            stats = self.node_stats[node] if node is not None else None
+            for node in reversed(missing):
+                stats = parse_comment(node.comment, stats)
+                self.node_stats[node] = stats
+
+        return stats
+
+    def index_statistics(self):
+        # Parse every comment once, parents before their children, e.g. of a game read by python-chess.
+        # Nodes without a comment keep the statistics they were created with
+        node_stats = {}
+        stack = [(self.game, None)]
+        while stack:
+            node, parent_stats = stack.pop()
+            stats = self.node_stats.get(node) if not node.comment else None
+            if stats is None:
+                stats = parse_comment(node.comment, parent_stats)
+            node_stats[node] = stats
+            for variation in node.variations:
+                stack.append((variation, stats))
+        self.node_stats = node_stats
+
+    def invalidate_statistics(self, node):
+        self.invalidate_columns()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if self.node_stats.pop(node, None) is not None:
+                stack.extend(node.variations)
+
+    def get_node_key(self, node=None):
+        if node is None:
+            node = self.current_node
+
+        key = self.node_keys.get(node)
+        if key is None:
+            # Start from the nearest ancestor with a known position instead of replaying every move from the root
+            missing = []
+            while node is not None and node not in self.node_keys:
+                missing.append(node)
+                node = node.parent
+
+            board = chess.Board(self.node_keys[node]) if node is not None else None
+            for node in reversed(missing):
+                if board is None:
+                    board = node.board()
+                else:
+                    board.push(node.move)
+                key = get_position_key(board)
+                self.node_keys[node] = key
+                self.position_index.setdefault(key, []).append(node)
+
+        return key
+
+    def index_positions(self):
+        # Key every node once, the boards are pushed along the walk instead of replayed per node
+        self.node_keys = {}
+        self.position_index = {}
+        stack = [(self.game, self.game.board())]
+        while stack:
+            node, board = stack.pop()
+            key = get_position_key(board)
+            self.node_keys[node] = key
+            self.position_index.setdefault(key, []).append(node)
+            for variation in node.variations:
+                child_board = board.copy(stack=False)
+                child_board.push(variation.move)
+                stack.append((variation, child_board))
+        self.positions_indexed = True
+
+    def reset_position_index(self):
+        self.invalidate_columns()
+        self.node_keys = {}
+        self.position_index = {}
+        self.positions_indexed = False
+
+    def find_nodes(self, fen):
+        # All nodes reaching the position, no matter the move order or the move counters
+        epd = chess.Board(fen).epd()
+        if self.graph_root is not None or self.tree_file is not None:
+            return self.find_lazy_nodes(epd)
+        if not self.positions_indexed:
+            self.index_positions()
+        return [node for key, nodes in self.position_index.items() if key.startswith(epd + " ") for node in nodes]
+
+    def find_lazy_nodes(self, epd):
+        # The paths are found on the shared positions, only the nodes along them are created
+        if self.graph_root is not None:
+            paths = find_position_paths(self.graph_root, self.game.board(), lambda position: [(edge.move, edge.target) for edge in position.edges], epd)
         else:
-            node_information['eco'] = ""
-            node_information['openingname'] = ""
-
-            # Recursively check parents if details are empty
-            if self.current_node.parent:
-                original_node = self.current_node
-                self.current_node = self.current_node.parent
-                parent_info = {}
-                parent_info = self.get_opening_details(parent_info)
-
-                # Update current node's information if parent's details are not empty
-                if parent_info['eco']:
-                    node_information['eco'] = parent_info['eco']
-                    node_information['openingname'] = parent_info['openingname']
-
-                self.current_node = original_node
-
-        return node_information
-    
-    def get_player_details(self, node_information):
-        comment = self.current_node.comment
-        wdb_match = re.search(r'\[freq: (\d+), (\d+(?:\.\d+)?)\]\[wdb: (\d+), (\d+), (\d+)\]\[wdb%: (\d+(?:\.\d+)?), (\d+(?:\.\d+)?), (\d+(?:\.\d+)?)\]', comment)
-        if wdb_match:
-            node_information['total_occurrence'] = int(wdb_match.group(1))
-            node_information['frequency'] = float(wdb_match.group(2))
-            node_information['white_wins'] = int(wdb_match.group(3))
-            node_information['draws'] = int(wdb_match.group(4))
-            node_information['black_wins'] = int(wdb_match.group(5))
-            node_information['white_percentage'] = float(wdb_match.group(6))
-            node_information['draw_percentage'] = float(wdb_match.group(7))
-            node_information['black_percentage'] = float(wdb_match.group(8))
-        else:
-            node_information['total_occurrence'] = 0
-            node_information['frequency'] = 0.0
-            node_information['white_wins'] = 0
-            node_information['draws'] = 0
-            node_information['black_wins'] = 0
-            node_information['white_percentage'] = 0.0
-            node_information['draw_percentage'] = 0.0
-            node_information['black_percentage'] = 0.0
-
-        return node_information
-
-    def get_engine_details(self, node_information):
-        comment = self.current_node.comment
-        eval_match = re.search(r'\[%eval ([-+]?\d*\.\d+|\d+),(\d+)\]', comment)
-        if eval_match:
-            node_information['eval'] = float(eval_match.group(1))
-            node_information['evaldepth'] = int(eval_match.group(2))
-        else:
-            node_information['eval'] = "?"
-            node_information['evaldepth'] = 0
-        
-        return node_information
-
-    def build_opening_tree(self, url="https://explorer.lichess.ovh/masters", relative_freq=100, min_occurrences=10000, engine_time=0.1):
-        fen = self.current_node.board().fen()
-
-        if fen in self.memoization_dict:
-            transposition = self.memoization_dict[fen]
-            # Replace the current node with the transposition in the parent node's variations
-            def add_subtree(transposition, counter):
-                # Replace only the relative frequency in the copied node's comment, keeping the original total occurrences
-                counter += 1
-                self.current_node.comment = transposition.comment
-                for transposition_variation in transposition.variations:
-                    child_node = self.current_node.add_variation(chess.Move.from_uci(transposition_variation.move.uci()))
-                    self.current_node = child_node
-                    counter = add_subtree(transposition_variation, counter)
-                    self.current_node = self.current_node.parent
-                return counter
-            
-            counter = add_subtree(transposition, 0)
-            self.current_node.comment = re.sub(r'\[freq: (\d+), \d+\]', f'[freq: \g<1>, {relative_freq}]', self.current_node.comment)
-
-            print(f"Transposition encountered for {fen} (size: {counter})")
+            paths = find_position_paths(0, self.game.board(), self.tree_file.get_edges, epd)
+
+        nodes = []
+        for path in paths:
+            node = self.game
+            for move in path:
+                node = node.variation(move)
+            nodes.append(node)
+        return nodes
+
+    def find_paths(self, fen):
+        paths = []
+        for node in self.find_nodes(fen):
+            path = []
+            while node.parent is not None:
+                path.append(node.move)
+                node = node.parent
+            paths.append(path[::-1])
+        return paths
+
+    def jump_to_fen(self, fen):
+        nodes = self.find_nodes(fen)
+        if nodes:
+            self.current_node = nodes[0]
             return self.current_node
-                
-        position_info = get_position_info(fen, url)
-        eval = get_stockfish_eval(self.current_node.board(), engine_time=engine_time)
-        self.current_node.set_eval(eval[0], eval[1])
-
-        opening = position_info.get("opening")
-        white_wins = position_info.get("white")
-        black_wins = position_info.get("black")
-        draws = position_info.get("draws")
-        total_occurrences = white_wins + black_wins + draws
-
-        white_percentage = round(white_wins / total_occurrences * 100, 2)
-        black_percentage = round(black_wins / total_occurrences * 100, 2)
-        draw_percentage = round(draws / total_occurrences * 100, 2)
-
-        if opening:
-            self.current_node.comment += f'[open: {opening["eco"]}, {opening["name"]}]'
-
-        self.current_node.comment += f'[freq: {total_occurrences}, {relative_freq}][wdb: {white_wins}, {draws}, {black_wins}][wdb%: {white_percentage}, {draw_percentage}, {black_percentage}]'
-
-        print(self.current_node)
-        for move in position_info.get("moves"):
-            move_occurrences = move["white"] + move["draws"] + move["black"]
-            if move_occurrences >= min_occurrences:
-                child_node = self.current_node.add_variation(chess.Move.from_uci(move["uci"]))
-                self.current_node = child_node
-                relative_frequency = round(move_occurrences / total_occurrences * 100, 2)
-                self.build_opening_tree(relative_freq=relative_frequency, min_occurrences=min_occurrences, engine_time=engine_time)
-                self.current_node = self.current_node.parent
-
-        self.memoization_dict[fen] = self.current_node
+        return None
+
+    def build_opening_tree(self, url="https://explorer.lichess.ovh/masters", relative_freq=100, min_occurrences=10000, engine_time=0.1, engine_pool=None, explorer=None, profile=None):
+        if engine_pool is None:
+            # Keep the same engine processes alive for the whole build
+            with EnginePool(cache=get_default_cache()) as engine_pool:
+                return self.build_opening_tree(url, relative_freq, min_occurrences, engine_time, engine_pool, explorer, profile)
+
+        explorer = explorer or get_default_client()
+        if profile is None:
+            profile = BuildProfile("Depth first build")
+        profile.track(explorer, engine_pool)
+        self.build_profile = profile
+
+        limit = chess.engine.Limit(time=engine_time)
+        self.game.headers["MinOccurrences"] = str(min_occurrences)
+        root = self.build_position(self.current_node.board(), url, min_occurrences, limit, engine_pool, explorer, profile)
+        with profile.phase("attach"):
+            self.attach_position_graph(self.current_node, root, relative_freq)
+        profile.finish()
         return self.current_node
-    
-    def get_size(self, node):
-        def calculate_size(current_node, current_depth):
-            nonlocal size
 
-            # Update nodes amount
-            size["nodes_amount"] += 1
+    def build_position(self, board, url, min_occurrences, limit, engine_pool, explorer, profile):
+        # Depth first with an explicit stack, every entry links its position into the edges of the parent when it is reached
+        root = None
+        stack = [(board, None, None, None, None)]
+        while stack:
+            board, eval_future, parent, move, relative_frequency = stack.pop()
+            fen = board.fen()
+            position = self.graph.get(fen)
+            if position is not None:
+                if eval_future:
+                    eval_future.cancel()
+                profile.count("transpositions")
+                logger.debug(f"Transposition encountered for {fen}")
+            else:
+                # Let the engine work while the explorer is queried
+                position = self.graph.add_position(fen)
+                if eval_future is None:
+                    eval_future = engine_pool.submit(board, limit)
+                with profile.phase("explorer"):
+                    position_info = get_position_info(fen, url, explorer)
+                with profile.phase("engine"):
+                    eval = eval_future.result()
+                with profile.phase("statistics"):
+                    stats = self.get_position_statistics(position_info, eval)
+                position.stats = stats
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"{fen} {format_comment(stats)}")
+
+                # Queue the evaluations of all new child positions so the pool can analyse them concurrently
+                with profile.phase("expansion"):
+                    children = []
+                    for child_move in self.get_frequent_moves(position_info, min_occurrences):
+                        child_board = board.copy(stack=False)
+                        child_board.push_uci(child_move["uci"])
+                        child_future = engine_pool.submit(child_board, limit) if child_board.fen() not in self.graph else None
+                        move_occurrences = child_move["white"] + child_move["draws"] + child_move["black"]
+                        children.append((child_board, child_future, position, child_board.peek(), round(move_occurrences / stats.total_occurrence * 100, 2)))
+                    stack.extend(reversed(children))
+                profile.count("nodes_expanded")
+                profile.progress(pending=len(stack))
+
+            if parent is None:
+                root = position
+            else:
+                parent.edges.append(Edge(move, relative_frequency, position))
+        return root
+
+    def build_opening_tree_breadth_first(self, url="https://explorer.lichess.ovh/masters", min_occurrences=10000, engine_time=0.1, engine_pool=None, explorer=None, checkpoint_file=None, checkpoint_interval=300, relative_freq=100, profile=None):
+        if engine_pool is None:
+            with EnginePool(cache=get_default_cache()) as engine_pool:
+                return self.build_opening_tree_breadth_first(url, min_occurrences, engine_time, engine_pool, explorer, checkpoint_file, checkpoint_interval, relative_freq, profile)
+        if explorer is None:
+            with ExplorerClient(cache=get_default_cache()) as explorer:
+                return self.build_opening_tree_breadth_first(url, min_occurrences, engine_time, engine_pool, explorer, checkpoint_file, checkpoint_interval, relative_freq, profile)
+
+        if profile is None:
+            profile = BuildProfile("Breadth first build")
+        profile.track(explorer, engine_pool)
+        self.build_profile = profile
+
+        limit = chess.engine.Limit(time=engine_time)
+        settings = {"url": url, "min_occurrences": min_occurrences, "engine_time": engine_time, "relative_freq": relative_freq}
+        self.game.headers["MinOccurrences"] = str(min_occurrences)
+
+        board = self.current_node.board()
+        root = self.graph.get(board.fen()) or self.graph.add_position(board.fen())
+
+        # Positions that are known but not expanded yet, e.g. after resuming from a checkpoint
+        frontier = [(position, chess.Board(position.fen)) for position in self.graph.get_reachable_positions(root) if position.stats is None]
+        depth = 0
+        last_checkpoint = time.monotonic()
+        with ThreadPoolExecutor(max_workers=explorer.concurrency, thread_name_prefix="explorer") as executor:
+            while frontier:
+                # Fetch the explorer data of the whole level while the engines analyse it
+                eval_futures = [engine_pool.submit(board, limit) for _, board in frontier]
+                info_futures = [executor.submit(explorer.get_position_info, position.fen, url) for position, _ in frontier]
+                logger.info(f"Depth {depth}: expanding {len(frontier)} positions")
+                profile.progress(pending=len(frontier), force=True)
+
+                next_frontier = []
+                added_positions = []
+                try:
+                    for index, ((position, board), info_future, eval_future) in enumerate(zip(frontier, info_futures, eval_futures)):
+                        with profile.phase("explorer"):
+                            position_info = info_future.result()
+                        with profile.phase("engine"):
+                            eval = eval_future.result()
+                        with profile.phase("statistics"):
+                            stats = self.get_position_statistics(position_info, eval)
+
+                        with profile.phase("expansion"):
+                            edges = []
+                            added_positions = []
+                            for move in self.get_frequent_moves(position_info, min_occurrences):
+                                child_board = board.copy(stack=False)
+                                child_board.push_uci(move["uci"])
+                                child_fen = child_board.fen()
+
+                                # A position reached before (or twice on this level) is shared instead of expanded again
+                                child_position = self.graph.get(child_fen)
+                                if child_position is None:
+                                    child_position = self.graph.add_position(child_fen)
+                                    added_positions.append(child_position)
+                                    next_frontier.append((child_position, child_board))
+                                else:
+                                    profile.count("transpositions")
+
+                                move_occurrences = move["white"] + move["draws"] + move["black"]
+                                relative_frequency = round(move_occurrences / stats.total_occurrence * 100, 2)
+                                edges.append(Edge(child_board.peek(), relative_frequency, child_position))
+
+                        # A position only counts as expanded once both its moves and statistics are set
+                        position.edges = edges
+                        position.stats = stats
+                        added_positions = []
+                        profile.count("nodes_expanded")
+                        profile.progress(pending=len(frontier) - index - 1 + len(next_frontier))
+
+                        if checkpoint_file and time.monotonic() - last_checkpoint >= checkpoint_interval:
+                            with profile.phase("checkpoint"):
+                                self.save_checkpoint(checkpoint_file, settings, root)
+                            last_checkpoint = time.monotonic()
+                except BaseException:
+                    for future in info_futures + eval_futures:
+                        future.cancel()
+                    # Forget the children of the half expanded position, it is expanded again on resume
+                    for position in added_positions:
+                        self.graph.remove_position(position)
+                    if checkpoint_file:
+                        self.save_checkpoint(checkpoint_file, settings, root)
+                    raise
+
+                frontier = next_frontier
+                depth += 1
+
+        with profile.phase("attach"):
+            self.attach_position_graph(self.current_node, root, relative_freq)
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        profile.finish()
+        return self.current_node
 
-            # Update breadth information
-            current_breadth = len(current_node.variations)
-            size["total_breadth"] += current_breadth
-            size["min_breadth"] = min(size["min_breadth"], current_breadth)
-            size["max_breadth"] = max(size["max_breadth"], current_breadth)
+    def build_opening_tree_from_pgn(self, pgn_files, min_occurrences=10000, engine_time=0.1, max_ply=20, processes=None, engine_pool=None, checkpoint_file=None, checkpoint_interval=300, relative_freq=100, profile=None):
+        # Count a local game database on all cores, then build from the counts exactly like from the explorer
+        if profile is None:
+            profile = BuildProfile("Database build")
+        with profile.phase("database"):
+            database = read_pgn_database(pgn_files, max_ply, min_occurrences, processes)
+        profile.track(database)
+        url = "pgn:" + (pgn_files if isinstance(pgn_files, str) else ",".join(pgn_files))
+        return self.build_opening_tree_breadth_first(url, min_occurrences, engine_time, engine_pool, database, checkpoint_file, checkpoint_interval, relative_freq, profile)
+
+    def refresh_opening_tree(self, url="https://explorer.lichess.ovh/masters", min_occurrences=10000, engine_time=0.1, eval_depth=None, engine_pool=None, explorer=None, profile=None):
+        if engine_pool is None:
+            with EnginePool(cache=get_default_cache()) as engine_pool:
+                return self.refresh_opening_tree(url, min_occurrences, engine_time, eval_depth, engine_pool, explorer, profile)
+        if explorer is None:
+            with ExplorerClient(cache=get_default_cache()) as explorer:
+                return self.refresh_opening_tree(url, min_occurrences, engine_time, eval_depth, engine_pool, explorer, profile)
+
+        if profile is None:
+            profile = BuildProfile("Refresh")
+        profile.track(explorer, engine_pool)
+        self.build_profile = profile
+
+        if self.graph_root is not None:
+            root, relative_freq = self.graph_root, self.graph_frequency
+        else:
+            # Trees loaded from a file are merged into a graph first, so new moves can share existing positions
+            self.graph, root = build_position_graph(self.game, self.get_node_statistics)
+            relative_freq = self.get_node_statistics(self.game).frequency
+        limit = chess.engine.Limit(depth=eval_depth) if eval_depth else chess.engine.Limit(time=engine_time)
+        self.game.headers["MinOccurrences"] = str(min_occurrences)
+
+        # Only the children of positions whose counts changed are queried again, every game below a position also passes through it
+        frontier = [root]
+        seen = {root}
+        refreshed = unchanged = expanded = 0
+        with ThreadPoolExecutor(max_workers=explorer.concurrency, thread_name_prefix="explorer") as executor:
+            while frontier:
+                info_futures = [executor.submit(explorer.get_position_info, position.fen, url) for position in frontier]
+                eval_futures = [engine_pool.submit(chess.Board(position.fen), limit) if position.stats is None else None for position in frontier]
+
+                next_frontier = []
+                for index, (position, info_future, eval_future) in enumerate(zip(frontier, info_futures, eval_futures)):
+                    with profile.phase("explorer"):
+                        position_info = info_future.result()
+                    with profile.phase("engine"):
+                        eval = eval_future.result() if eval_future else None
+                    with profile.phase("statistics"):
+                        stats = self.get_position_statistics(position_info, eval)
+                    profile.count("nodes_expanded")
+                    profile.progress(pending=len(frontier) - index - 1 + len(next_frontier))
+                    if position.stats is None:
+                        expanded += 1
+                    else:
+                        old_stats = position.stats
+                        if (stats.white_wins, stats.draws, stats.black_wins) == (old_stats.white_wins, old_stats.draws, old_stats.black_wins):
+                            unchanged += 1
+                            continue
+                        refreshed += 1
+                        stats.eval, stats.mate, stats.evaldepth = old_stats.eval, old_stats.mate, old_stats.evaldepth
+
+                    # Known moves keep their positions, newly qualifying moves get new (or transposed) ones
+                    board = chess.Board(position.fen)
+                    old_edges = {edge.move: edge for edge in position.edges}
+                    edges = []
+                    for move in self.get_frequent_moves(position_info, min_occurrences):
+                        move_occurrences = move["white"] + move["draws"] + move["black"]
+                        relative_frequency = round(move_occurrences / stats.total_occurrence * 100, 2)
+                        edge = old_edges.pop(chess.Move.from_uci(move["uci"]), None)
+                        if edge is None:
+                            board.push_uci(move["uci"])
+                            child_position = self.graph.get(board.fen()) or self.graph.add_position(board.fen())
+                            edge = Edge(board.pop(), relative_frequency, child_position)
+                        edge.frequency = relative_frequency
+                        edges.append(edge)
+
+                    # Moves that dropped below the threshold are kept, their share is recomputed if the explorer still lists them
+                    move_counts = {move["uci"]: move["white"] + move["draws"] + move["black"] for move in position_info.get("moves")}
+                    for edge in old_edges.values():
+                        if edge.move.uci() in move_counts:
+                            edge.frequency = round(move_counts[edge.move.uci()] / stats.total_occurrence * 100, 2)
+                        edges.append(edge)
+
+                    position.edges = edges
+                    position.stats = stats
+                    for edge in edges:
+                        if edge.target not in seen:
+                            seen.add(edge.target)
+                            next_frontier.append(edge.target)
+
+                logger.info(f"Refreshing {len(frontier)} positions: {refreshed} changed, {unchanged} unchanged, {expanded} new so far")
+                frontier = next_frontier
+
+        with profile.phase("deepen_evals"):
+            reevaluated = self.deepen_evals(root, eval_depth, engine_pool) if eval_depth else 0
+        profile.count("refreshed", refreshed)
+        profile.count("unchanged", unchanged)
+        profile.count("new_positions", expanded)
+        profile.count("evals_deepened", reevaluated)
+        logger.info(f"Refresh done: {refreshed} changed, {unchanged} unchanged subtrees skipped, {expanded} new positions, {reevaluated} evals deepened")
+
+        with profile.phase("attach"):
+            self.current_node = self.game
+            self.attach_position_graph(self.game, root, relative_freq)
+        profile.finish()
+        return self.game
+
+    def deepen_evals(self, root, eval_depth, engine_pool):
+        # Evals are kept unless they were searched less deep than asked for
+        limit = chess.engine.Limit(depth=eval_depth)
+        positions = [position for position in self.graph.get_reachable_positions(root) if position.stats is not None and position.stats.evaldepth < eval_depth]
+        eval_futures = [engine_pool.submit(chess.Board(position.fen), limit) for position in positions]
+        for position, eval_future in zip(positions, eval_futures):
+            self.set_eval(position.stats, eval_future.result())
+        return len(positions)
+
+    def save_checkpoint(self, filename, settings, root):
+        # Unexpanded positions are stored without statistics, they form the frontier when resuming
+        positions = self.graph.get_reachable_positions(root)
+        indices = {position: index for index, position in enumerate(positions)}
+        checkpoint = dict(settings)
+        checkpoint["positions"] = [[
+            position.fen,
+            None if position.stats is None else [getattr(position.stats, name) for name in NodeStats.__slots__],
+            [[edge.move.uci(), edge.frequency, indices[edge.target]] for edge in position.edges]
+        ] for position in positions]
+
+        # Write next to the old checkpoint first so a crash while saving never loses it
+        temporary_filename = filename + ".tmp"
+        with open(temporary_filename, 'w') as file:
+            json.dump(checkpoint, file)
+        os.replace(temporary_filename, filename)
+        logger.info(f"Checkpoint saved to {filename} ({sum(position.stats is None for position in positions)} positions left in the frontier)")
+
+    def resume_opening_tree(self, checkpoint_file, engine_pool=None, explorer=None, checkpoint_interval=300, profile=None):
+        with open(checkpoint_file, 'r') as file:
+            checkpoint = json.load(file)
+
+        # The first position is the one the build started from
+        positions = [self.graph.get(fen) or self.graph.add_position(fen) for fen, _, _ in checkpoint["positions"]]
+        for position, (_, stats, edges) in zip(positions, checkpoint["positions"]):
+            if stats is not None and position.stats is None:
+                position.edges = [Edge(chess.Move.from_uci(uci), frequency, positions[index]) for uci, frequency, index in edges]
+                position.stats = NodeStats(*stats)
 
-            # Update depth information
-            size["total_depth"] += current_depth
-            size["min_depth"] = min(size["min_depth"], current_depth)
-            size["max_depth"] = max(size["max_depth"], current_depth)
+        self.current_node = self.game
+        if self.game.board().fen() != positions[0].fen:
+            self.game.setup(chess.Board(positions[0].fen))
+
+        return self.build_opening_tree_breadth_first(checkpoint["url"], checkpoint["min_occurrences"], checkpoint["engine_time"], engine_pool, explorer, checkpoint_file, checkpoint_interval, checkpoint["relative_freq"], profile)
+
+    def fetch_children(self, fen, url, min_occurrences, limit, engine_pool, explorer, known_moves=()):
+        # Statistics of the frequent moves of one position, the tree is not touched so this can run in a worker.
+        # Moves the tree already has are not fetched again
+        board = chess.Board(fen)
+        position_info = get_position_info(fen, url, explorer)
+        total_occurrence = position_info.get("white") + position_info.get("draws") + position_info.get("black")
+
+        known_moves = {move.uci() for move in known_moves}
+        moves = [move for move in self.get_frequent_moves(position_info, min_occurrences) if move["uci"] not in known_moves]
+        child_boards = []
+        for move in moves:
+            child_board = board.copy(stack=False)
+            child_board.push_uci(move["uci"])
+            child_boards.append(child_board)
+        eval_futures = [engine_pool.submit(child_board, limit) for child_board in child_boards]
+
+        children = []
+        for move, child_board, eval_future in zip(moves, child_boards, eval_futures):
+            child_info = get_position_info(child_board.fen(), url, explorer)
+            stats = self.get_position_statistics(child_info, eval_future.result())
+            move_occurrences = move["white"] + move["draws"] + move["black"]
+            relative_frequency = round(move_occurrences / total_occurrence * 100, 2)
+            children.append((child_board.peek(), relative_frequency, stats))
+        return children
+
+    def add_children(self, node, children):
+        # Leaves get all children, nodes that have some already only the moves they are missing
+        known_moves = {variation.move for variation in node.variations}
+        children = [child for child in children if child[0] not in known_moves]
+        if not children:
+            return False
+
+        self.invalidate_columns()
+        if self.graph_root is not None:
+            # Grow the shared position so every path to it sees the new moves
+            key = self.get_node_key(node)
+            position = self.graph.get(key)
+            board = chess.Board(position.fen)
+            position_moves = {edge.move for edge in position.edges}
+            for move, frequency, stats in children:
+                if move not in position_moves:
+                    board.push(move)
+                    child_position = self.graph.get(board.fen()) or self.graph.add_position(board.fen(), stats)
+                    board.pop()
+                    position.edges.append(Edge(move, frequency, child_position))
+
+            # Other paths to the position that were expanded already get the new moves too, lazy ones see them when they are visited
+            view = GraphView(self.node_stats)
+            for other_node in set(self.position_index.get(key, [])) | {node}:
+                if getattr(other_node, "_tree_source", None) is None:
+                    other_moves = {variation.move for variation in other_node.variations}
+                    view.expand(other_node, position, [edge for edge in position.edges if edge.move not in other_moves])
+        else:
+            parent_stats = self.get_node_statistics(node)
+            for move, frequency, stats in children:
+                child_node = node.add_variation(move)
+                child_stats = derive_stats(stats, frequency, parent_stats)
+                self.node_stats[child_node] = child_stats
+
+        for child_node in node.variations:
+            self.get_node_key(child_node)
+        return True
+
+    def get_min_occurrences(self, default=10000):
+        # The threshold the tree was built with. Trees built before it was written into the headers tell the fewest games a kept move has
+        if "MinOccurrences" in self.game.headers:
+            return int(self.game.headers["MinOccurrences"])
+        occurrences = [self.get_node_statistics(node).total_occurrence for node, depth, _, _ in self.preorder(self.game, loaded_only=True) if depth]
+        return min(occurrences) if occurrences else default
+
+    def get_position_statistics(self, position_info, eval=None):
+        stats = NodeStats()
+        if eval is not None:
+            self.set_eval(stats, eval)
 
-            # Recursively calculate size for child nodes
-            for variation in current_node.variations:
-                calculate_size(variation, current_depth + 1)
+        opening = position_info.get("opening")
+        if opening:
+            stats.eco = opening["eco"]
+            stats.openingname = opening["name"]
+            stats.has_opening = True
+
+        stats.white_wins = position_info.get("white")
+        stats.black_wins = position_info.get("black")
+        stats.draws = position_info.get("draws")
+        stats.total_occurrence = stats.white_wins + stats.black_wins + stats.draws
+
+        stats.white_percentage = round(stats.white_wins / stats.total_occurrence * 100, 2)
+        stats.black_percentage = round(stats.black_wins / stats.total_occurrence * 100, 2)
+        stats.draw_percentage = round(stats.draws / stats.total_occurrence * 100, 2)
+        return stats
+
+    def set_eval(self, stats, eval):
+        score, depth = eval
+        stats.evaldepth = max(depth, 0)
+        stats.eval = None
+        stats.mate = None
+        white_score = score.white()
+        if white_score.score() is not None:
+            stats.eval = white_score.score() / 100
+        elif white_score.mate():
+            stats.mate = white_score.mate()
+
+    def get_frequent_moves(self, position_info, min_occurrences):
+        return [move for move in position_info.get("moves") if move["white"] + move["draws"] + move["black"] >= min_occurrences]
+
+    def attach_position_graph(self, node, root, relative_freq):
+        # The game tree becomes a lazy view of the graph, shared positions get nodes per path only when visited
+        self.invalidate_statistics(node)
+        self.reset_position_index()
+        self.graph.attach(node, root, relative_freq, self.node_stats)
+        if node is self.game:
+            self.graph_root = root
+            self.graph_frequency = relative_freq
+
+    def get_position_graph(self):
+        # The graph the tree was built from, or one merged from the game tree when it was loaded from a file
+        if self.graph_root is not None:
+            return self.graph_root, self.graph_frequency
+        _, root = build_position_graph(self.game, self.get_node_statistics)
+        return root, self.get_node_statistics(self.game).frequency
+
+    def get_columns(self, node=None, max_depth=None, max_age=None, loaded_only=False):
+        # The subtree as NumPy columns for vectorized queries, exported once until the tree changes.
+        # With max_age an export of an older tree is kept for that many seconds, so a tree growing all the time is not exported on every change.
+        # With loaded_only the nodes of a lazy tree that were not read yet are left out, and their parents are leaves
+        if node is None:
+            node = self.game
+        entry = self.columns.get((node, max_depth, loaded_only))
+        if entry is None or not self.is_current(entry, max_age):
+            if len(self.columns) >= 32:
+                # Browsing asks for the children of every visited node, only the recent ones are worth keeping
+                self.columns = {}
+            entry = self.columns[node, max_depth, loaded_only] = (self.version, time.monotonic(), export_columns(self, node, max_depth, loaded_only))
+        return entry[2]
+
+    def invalidate_columns(self):
+        self.version += 1
+
+    def is_current(self, entry, max_age=None):
+        version, built, _ = entry
+        return version == self.version or (max_age is not None and time.monotonic() - built < max_age)
+
+    def get_repertoire(self, color, criterion="expectimax", max_age=None, node=None, loaded_only=False):
+        # Best moves and expected scores of the whole tree for one side, computed once until the tree changes.
+        # A stale repertoire is only reused while it still has node, with all of its children read so far when loaded_only.
+        # Browsing a lazy tree asks with loaded_only, so only the part read so far is valued instead of reading the whole file
+        entry = self.repertoires.get((color, criterion, loaded_only))
+        if entry is None or not self.is_current(entry, max_age) or (node is not None and not self.has_node(entry[2].columns, node, loaded_only)):
+            columns = self.get_columns(max_age=max_age, loaded_only=loaded_only)
+            if node is not None and not self.has_node(columns, node, loaded_only):
+                # The tree changed since the export, or children were read from the file, which does not change the version
+                self.columns.pop((self.game, None, loaded_only), None)
+                columns = self.get_columns(loaded_only=loaded_only)
+            entry = self.repertoires[color, criterion, loaded_only] = (self.version, time.monotonic(), build_repertoire(columns, color, criterion))
+        return entry[2]
+
+    def has_node(self, columns, node, loaded_only=False):
+        row = columns.get_node_index(node)
+        return row is not None and (not loaded_only or columns.child_count[row] == len(get_loaded_variations(node)))
+
+    def get_most_common_child(self, node=None):
+        if node is None:
+            node = self.current_node
+        columns = self.get_columns(node, max_depth=1)
+        row = columns.get_best_child(0, columns.frequency)
+        return columns.nodes[row] if row is not None else None
+
+    def get_best_child(self, node=None, criterion="expectimax", max_age=None):
+        # The best move of the side to move with best play below it
+        if node is None:
+            node = self.current_node
+        # Only the children of a lazy node are read, the rest of the file stays where it is
+        if not node.variations:
+            return None
+        repertoire = self.get_repertoire(node.turn(), criterion, max_age, node, loaded_only=True)
+        row = repertoire.get_best_child(repertoire.get_row(node))
+        return repertoire.columns.nodes[row] if row >= 0 else None
+
+    def save_repertoire(self, filename, color, min_reach=0.01, max_depth=None, criterion="expectimax"):
+        # Only the chosen move of color and the replies reached often enough are written
+        repertoire = self.get_repertoire(color, criterion)
+        headers = chess.pgn.Headers(self.game.headers)
+        headers["Event"] = f"{'White' if color == chess.WHITE else 'Black'} repertoire"
+        with open(filename, 'w') as file:
+            repertoire.write_pgn(file, headers, self.get_node_statistics, min_reach, max_depth)
+
+    def preorder(self, node=None, max_depth=None, prune=None, paths=False, loaded_only=False):
+        return self.traverse(node, False, max_depth, prune, paths, loaded_only)
+
+    def breadth_first(self, node=None, max_depth=None, prune=None, paths=False, loaded_only=False):
+        return self.traverse(node, True, max_depth, prune, paths, loaded_only)
+
+    def traverse(self, node=None, breadth_first=False, max_depth=None, prune=None, paths=False, loaded_only=False):
+        # Yields (node, depth, parent stats, moves from the start node) without recursion.
+        # prune(node, depth) is asked after the node was yielded, so the caller can decide on what it just saw
+        if node is None:
+            node = self.current_node
+
+        pending = deque([(node, 0, self.get_node_statistics(node.parent) if node.parent else None, () if paths else None)])
+        pop = pending.popleft if breadth_first else pending.pop
+        node_stats = self.node_stats
+        while pending:
+            node, depth, parent_stats, path = pop()
+            yield node, depth, parent_stats, path
+
+            if (max_depth is not None and depth >= max_depth) or (prune is not None and prune(node, depth)):
+                continue
+            # loaded_only keeps lazy trees as far as they were browsed
+            variations = get_loaded_variations(node) if loaded_only else node.variations
+            if variations:
+                stats = node_stats.get(node) or self.get_node_statistics(node)
+                depth += 1
+                if paths:
+                    children = [(variation, depth, stats, path + (variation.move,)) for variation in variations]
+                else:
+                    children = [(variation, depth, stats, None) for variation in variations]
+                pending.extend(children if breadth_first else reversed(children))
 
+    def get_size(self, node):
         # Initialize size dictionary
         size = {
             "nodes_amount": 0,
@@ -173,11 +715,27 @@ class OpeningTree:
             "min_depth": float('inf'),
             "max_depth": 0,
             "total_depth": 0,
-            "avg_depth": 0
+            "avg_depth": 0,
+            "depth_counts": {},
+            "breadth_histogram": {}
         }
 
-        # Start calculating size from the root node
-        calculate_size(node, 0)
+        # One pass over the tree, starting from the given node
+        depth_counts = size["depth_counts"]
+        breadth_histogram = size["breadth_histogram"]
+        for current_node, current_depth, _, _ in self.preorder(node):
+            current_breadth = len(current_node.variations)
+            depth_counts[current_depth] = depth_counts.get(current_depth, 0) + 1
+            breadth_histogram[current_breadth] = breadth_histogram.get(current_breadth, 0) + 1
+
+        # Everything else follows from the histograms
+        size["nodes_amount"] = sum(depth_counts.values())
+        size["total_breadth"] = sum(breadth * count for breadth, count in breadth_histogram.items())
+        size["min_breadth"] = min(breadth_histogram)
+        size["max_breadth"] = max(breadth_histogram)
+        size["total_depth"] = sum(depth * count for depth, count in depth_counts.items())
+        size["min_depth"] = min(depth_counts)
+        size["max_depth"] = max(depth_counts)
 
         # Calculate average breadth and depth
         size["avg_breadth"] = size["total_breadth"] / size["nodes_amount"] if size["nodes_amount"] > 0 else 0
@@ -186,36 +744,66 @@ class OpeningTree:
         return size
 
     def load_opening_tree(self, filename):
+        self.close_tree_file()
+        self.graph = PositionGraph()
+        self.graph_root = None
+        self.reset_position_index()
+        if filename.endswith(BINARY_EXTENSION):
+            # Nodes and their statistics are created from the memory-mapped file when they are first visited
+            self.tree_file = TreeFile(filename)
+            self.node_stats = {}
+            self.game = self.tree_file.load_game(self.node_stats)
+            self.current_node = self.game
+            return
+
+        # Streamed token by token, the comments go straight into node_stats
+        self.node_stats = {}
         with open(filename, 'r') as file:
-            self.game = chess.pgn.read_game(file)
+            self.game = read_pgn_tree(file, self.node_stats)
             self.current_node = self.game
+        self.index_positions()
 
     def save_opening_tree(self, filename):
+        if filename.endswith(BINARY_EXTENSION):
+            root, frequency = self.get_position_graph()
+            if self.tree_file is not None and os.path.abspath(self.tree_file.filename) == os.path.abspath(filename):
+                # The mapped file is about to be replaced, so every node still has to be read from it
+                stack = [self.game]
+                while stack:
+                    stack.extend(stack.pop().variations)
+                self.close_tree_file()
+            save_binary_tree(root, frequency, filename)
+            return
+
         with open(filename, 'w') as file:
-            file.write(str(self.game))
-
-
-def get_position_info(fen, url):
-    params = {"fen": fen}
-    response = requests.get(url, params=params)
-    if response.status_code == 200:
-        return response.json()
-    elif response.status_code == 429:
-        print("Opening explorer: Too many requests -> Waiting 1 minute")
-        time.sleep(60)
-        return get_position_info(fen, url)
-    else:
-        print(f"Error: {response.status_code}")
-        print(response.text)
-        return []
-    
-
-def get_stockfish_eval(board, engine_time=0.1):
-    stockfish_path = "stockfish.exe"  
-    with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
-            result = engine.analyse(board, chess.engine.Limit(time=engine_time))
+            if self.graph_root is not None:
+                # Shared positions are written once per path straight from the graph, the browsed tree does not grow
+                write_position_graph(file, self.game.headers, self.graph_root, self.graph_frequency)
+            else:
+                write_game_tree(file, self.game, self.get_node_statistics)
+
+    def close_tree_file(self):
+        if self.tree_file is not None:
+            self.tree_file.close()
+            self.tree_file = None
+
+
+def get_stockfish_eval(board, engine_time=0.1, engine_pool=None):
+    limit = chess.engine.Limit(time=engine_time)
+    if engine_pool:
+        return engine_pool.analyse(board, limit)
+
+    cache = get_default_cache()
+    eval = cache.get_eval(board, limit) if cache else None
+    if eval is not None:
+        return eval
+
+    with chess.engine.SimpleEngine.popen_uci(config.ENGINE_PATH) as engine:
+            result = engine.analyse(board, limit)
             pov_score = result["score"]
             depth = result["depth"]
+            if cache:
+                cache.set_eval(board, limit, (pov_score, depth))
             return pov_score, depth
 
 
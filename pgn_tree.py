@@ -0,0 +1,200 @@
+import re
+import chess
+import chess.pgn
+
+from stats import derive_stats, format_comment, parse_comment
+
+HEADER_REGEX = re.compile(r'\[([A-Za-z0-9_]+)\s+"(.*)"\]\s*$')
+TOKEN_REGEX = re.compile(r'\{[^}]*\}|\(|\)|[^\s(){}]+')
+MOVE_NUMBER_REGEX = re.compile(r'\d+\.+$')
+# The end of a chunk that may be the start of a longer token
+PARTIAL_TOKEN_REGEX = re.compile(r'[^\s(){}]*\Z')
+RESULTS = {"*", "1-0", "0-1", "1/2-1/2"}
+BUFFER_SIZE = 1 << 16
+
+
+class PgnWriter:
+    # Writes movetext token by token the way python-chess' FileExporter does, in lines of at most columns characters
+    def __init__(self, file, columns=80):
+        self.file = file
+        self.columns = columns
+        self.buffer = []
+        self.buffered = 0
+        self.current_line = ""
+        self.force_movenumber = True
+
+    def write_token(self, token):
+        if self.columns is not None and self.columns - len(self.current_line) < len(token):
+            self.write_line()
+        self.current_line += token
+
+    def write_line(self):
+        # A token longer than a line gets a line of its own
+        if self.current_line:
+            line = self.current_line.rstrip() + "\n"
+            self.buffer.append(line)
+            self.buffered += len(line)
+            if self.buffered >= BUFFER_SIZE:
+                self.flush()
+        self.current_line = ""
+
+    def write_headers(self, headers):
+        for tagname, tagvalue in headers.items():
+            self.file.write(f'[{tagname} "{tagvalue}"]\n')
+        if headers:
+            self.file.write("\n")
+
+    def write_comment(self, comment):
+        self.write_token("{ " + comment.replace("}", "").strip() + " } ")
+        self.force_movenumber = True
+
+    def write_move(self, board, move):
+        if board.turn == chess.WHITE:
+            self.write_token(f"{board.fullmove_number}. ")
+        elif self.force_movenumber:
+            self.write_token(f"{board.fullmove_number}... ")
+        self.write_token(board.san(move) + " ")
+        self.force_movenumber = False
+
+    def begin_variation(self):
+        self.write_token("( ")
+        self.force_movenumber = True
+
+    def end_variation(self):
+        self.write_token(") ")
+        self.force_movenumber = True
+
+    def flush(self):
+        self.file.write("".join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+
+
+def write_pgn(file, headers, board, comment, variations, get_variations):
+    # Iterative version of python-chess' exporter: main move, its sidelines, then the main line continues.
+    # variations are (move, comment, item) tuples and get_variations(item) returns those of an item
+    writer = PgnWriter(file)
+    writer.write_headers(headers)
+    if comment:
+        writer.write_comment(comment)
+
+    if variations:
+        # A frame is [variation, siblings, next sideline, state, in variation]
+        stack = [[variations[0], variations, 1, "pre", False]]
+        while stack:
+            top = stack[-1]
+            (move, comment, item), siblings = top[0], top[1]
+            if top[4]:
+                top[4] = False
+                writer.end_variation()
+
+            if top[3] == "pre":
+                writer.write_move(board, move)
+                if comment:
+                    writer.write_comment(comment)
+                top[3] = "variations"
+            elif top[3] == "variations":
+                if top[2] < len(siblings):
+                    sideline = siblings[top[2]]
+                    top[2] += 1
+                    writer.begin_variation()
+                    stack.append([sideline, siblings, len(siblings), "pre", False])
+                    top[4] = True
+                else:
+                    children = get_variations(item)
+                    if children:
+                        board.push(move)
+                        stack.append([children[0], children, 1, "pre", False])
+                        top[3] = "post"
+                    else:
+                        top[3] = "end"
+            elif top[3] == "post":
+                board.pop()
+                top[3] = "end"
+            else:
+                stack.pop()
+
+    writer.write_token(headers.get("Result", "*") + " ")
+    writer.write_line()
+    writer.flush()
+    file.write("\n")
+
+
+def write_game_tree(file, game, get_statistics):
+    # Comments are written from the node statistics, nodes do not hold them
+    def get_variations(node):
+        return [(variation.move, format_comment(get_statistics(variation)), variation) for variation in node.variations]
+
+    write_pgn(file, game.headers, game.board(), format_comment(get_statistics(game), root=True), get_variations(game), get_variations)
+
+
+def write_position_graph(file, headers, root, frequency):
+    # Every path through a shared position is written out without creating game nodes for it
+    def get_variations(item):
+        position, stats = item
+        variations = []
+        for edge in position.edges:
+            if edge.target.stats is None:
+                variations.append((edge.move, "", (edge.target, None)))
+            else:
+                child_stats = derive_stats(edge.target.stats, edge.frequency, stats)
+                variations.append((edge.move, format_comment(child_stats), (edge.target, child_stats)))
+        return variations
+
+    stats = derive_stats(root.stats, frequency) if root.stats is not None else None
+    comment = format_comment(stats, root=True) if stats is not None else ""
+    write_pgn(file, headers, chess.Board(root.fen), comment, get_variations((root, stats)), get_variations)
+
+
+def read_tokens(file, text="", chunk_size=BUFFER_SIZE):
+    # Movetext tokens from chunks of the file. A token or comment still open at the end of a chunk is carried into the next one
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            yield from TOKEN_REGEX.findall(text)
+            return
+        text += chunk
+        comment_start = text.find("{", text.rfind("}") + 1)
+        end = comment_start if comment_start >= 0 else PARTIAL_TOKEN_REGEX.search(text).start()
+        yield from TOKEN_REGEX.findall(text, 0, end)
+        text = text[end:]
+
+
+def read_pgn_tree(file, node_stats, chunk_size=BUFFER_SIZE):
+    # Builds the first game of the file from a stream of tokens. Comments are parsed into node_stats, the nodes do not keep them
+    game = chess.pgn.Game()
+    line = file.readline()
+    while line and (not line.strip() or line.startswith("[")):
+        header_match = HEADER_REGEX.match(line.strip())
+        if header_match:
+            game.headers[header_match.group(1)] = header_match.group(2)
+        line = file.readline()
+
+    board = game.board()
+    node = game
+    node_stats[game] = parse_comment("")
+    variation_stack = []
+    # The first line of the movetext was already read with the headers
+    for token in read_tokens(file, line, chunk_size):
+        if token.startswith("{"):
+            node_stats[node] = parse_comment(token[1:-1].strip(), node_stats.get(node.parent) if node.parent else None)
+        elif token == "(":
+            variation_stack.append((node, len(board.move_stack), board.pop()))
+            node = node.parent
+        elif token == ")":
+            node, length, move = variation_stack.pop()
+            while len(board.move_stack) >= length:
+                board.pop()
+            board.push(move)
+        elif token in RESULTS:
+            if not variation_stack:
+                return game
+        elif token.startswith("$") or MOVE_NUMBER_REGEX.match(token):
+            continue
+        else:
+            move = board.parse_san(token)
+            board.push(move)
+            parent_stats = node_stats[node]
+            node = node.add_variation(move)
+            node_stats[node] = parse_comment("", parent_stats)
+    return game
@@ -0,0 +1,212 @@
+import threading
+import chess
+import chess.pgn
+from collections import deque
+
+from stats import derive_stats, format_comment
+
+
+# Nodes are expanded one at a time, a tree may be read by the display and saved by another thread at once
+EXPAND_LOCK = threading.RLock()
+# The tree source of a node while its children are created, other threads wait for all of them
+EXPANDING = object()
+
+
+class LazyNode:
+    # Children are only created by the tree source when the variations are first accessed
+    _tree_source = None
+    _tree_index = None
+
+    @property
+    def variations(self):
+        if self._tree_source is not None:
+            with EXPAND_LOCK:
+                tree_source = self._tree_source
+                if tree_source is not None and tree_source is not EXPANDING:
+                    self._tree_source = EXPANDING
+                    try:
+                        tree_source.expand(self, self._tree_index)
+                    finally:
+                        self._tree_source = None
+        return self._variations
+
+    @variations.setter
+    def variations(self, variations):
+        self._variations = variations
+
+
+def get_loaded_variations(node):
+    # The children that exist already, a lazy node that was never visited is not expanded for this
+    if getattr(node, "_tree_source", None) is not None:
+        return []
+    return node.variations
+
+
+class LazyGame(LazyNode, chess.pgn.Game):
+    pass
+
+
+class LazyChildNode(LazyNode, chess.pgn.ChildNode):
+    pass
+
+
+def get_position_key(board):
+    # Positions are shared no matter the halfmove clock, so transpositions are one position. The move number stays, it keeps repetitions apart
+    return f"{board.epd()} 0 {board.fullmove_number}"
+
+
+def get_fen_key(fen):
+    # The same key from a FEN written by board.fen(), without setting up a board
+    fields = fen.split()
+    return f"{' '.join(fields[:4])} 0 {fields[5] if len(fields) > 5 else 1}"
+
+
+class Edge:
+    __slots__ = ("move", "frequency", "target")
+
+    def __init__(self, move, frequency, target):
+        self.move = move
+        # Relative frequency of the move in the parent position
+        self.frequency = frequency
+        self.target = target
+
+
+class Position:
+    __slots__ = ("fen", "stats", "edges")
+
+    def __init__(self, fen, stats=None):
+        self.fen = fen
+        # None until the position has been expanded
+        self.stats = stats
+        self.edges = []
+
+
+class PositionGraph:
+    def __init__(self):
+        # Positions by get_position_key, each keeps the FEN of the first path that reached it
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, fen):
+        return get_fen_key(fen) in self.positions
+
+    def get(self, fen):
+        return self.positions.get(get_fen_key(fen))
+
+    def add_position(self, fen, stats=None):
+        position = Position(fen, stats)
+        self.positions[get_fen_key(fen)] = position
+        return position
+
+    def remove_position(self, position):
+        del self.positions[get_fen_key(position.fen)]
+
+    def get_reachable_positions(self, root):
+        # Every position below root once, in breadth-first order
+        positions = [root]
+        seen = {root}
+        for position in positions:
+            for edge in position.edges:
+                if edge.target not in seen:
+                    seen.add(edge.target)
+                    positions.append(edge.target)
+        return positions
+
+    def load_game(self, root, frequency=100, node_stats=None):
+        # A game tree view of the graph, every path to a shared position gets its own nodes when it is visited
+        game = LazyGame()
+        GraphView(node_stats).attach(game, root, frequency)
+        return game
+
+    def attach(self, node, root, frequency=100, node_stats=None):
+        GraphView(node_stats).attach(node, root, frequency)
+
+
+class GraphView:
+    def __init__(self, node_stats=None):
+        self.node_stats = node_stats
+
+    def attach(self, node, position, frequency):
+        parent_stats = self.node_stats.get(node.parent) if self.node_stats is not None and node.parent else None
+        self.set_node(node, position, frequency, parent_stats)
+        if isinstance(node, LazyNode):
+            self.set_lazy(node, position)
+        else:
+            node.variations = []
+            self.expand(node, position)
+
+    def expand(self, node, position, edges=None):
+        parent_stats = self.node_stats.get(node) if self.node_stats is not None else None
+        for edge in position.edges if edges is None else edges:
+            child_node = LazyChildNode(node, edge.move)
+            self.set_node(child_node, edge.target, edge.frequency, parent_stats)
+            self.set_lazy(child_node, edge.target)
+
+    def set_node(self, node, position, frequency, parent_stats):
+        if position.stats is None:
+            return
+
+        stats = derive_stats(position.stats, frequency, parent_stats)
+        if self.node_stats is not None:
+            self.node_stats[node] = stats
+        else:
+            # Without an index of the statistics the comment is the only place to keep them
+            node.comment = format_comment(stats, root=node.parent is None)
+
+    def set_lazy(self, node, position):
+        if position.edges:
+            node._tree_index = position
+            node._tree_source = self
+
+
+def find_position_paths(root, board, get_edges, epd):
+    # The move orders from root to every position with the given EPD, found on the shared positions without creating tree nodes.
+    # get_edges(position) gives the (move, target) pairs of a position
+    parents = {root: []}
+    targets = []
+    queue = deque([(root, board)])
+    while queue:
+        position, board = queue.popleft()
+        if board.epd() == epd:
+            targets.append(position)
+        for move, target in get_edges(position):
+            if target not in parents:
+                parents[target] = []
+                child_board = board.copy(stack=False)
+                child_board.push(move)
+                queue.append((target, child_board))
+            parents[target].append((position, move))
+
+    paths = []
+    stack = [(target, []) for target in reversed(targets)]
+    while stack:
+        position, moves = stack.pop()
+        if position == root:
+            paths.append(moves[::-1])
+        for parent, move in reversed(parents[position]):
+            stack.append((parent, moves + [move]))
+    return paths
+
+
+def build_position_graph(game, get_statistics):
+    # Merge every path to the same position into one shared position, the first path decides its moves
+    graph = PositionGraph()
+    root = graph.add_position(game.board().fen(), derive_stats(get_statistics(game), 0))
+    stack = [(game, game.board(), root)]
+    while stack:
+        node, board, position = stack.pop()
+        for variation in reversed(node.variations):
+            child_board = board.copy(stack=False)
+            child_board.push(variation.move)
+            fen = child_board.fen()
+
+            stats = get_statistics(variation)
+            child_position = graph.get(fen)
+            if child_position is None:
+                child_position = graph.add_position(fen, derive_stats(stats, 0))
+                stack.append((variation, child_board, child_position))
+            position.edges.append(Edge(variation.move, stats.frequency, child_position))
+        position.edges.reverse()
+    return graph, root
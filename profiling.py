@@ -0,0 +1,135 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("opening")
+
+
+class BuildProfile:
+    def __init__(self, name="build", callback=None, interval=10.0, explorer=None, engine_pool=None):
+        self.name = name
+        # Called with the progress report every interval seconds, in addition to the log message
+        self.callback = callback
+        self.interval = interval
+        self.explorer = explorer
+        self.engine_pool = engine_pool
+
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.calls = {}
+        self.counters = {"nodes_expanded": 0, "transpositions": 0}
+        self.pending = None
+        self.started = time.monotonic()
+        self.finished = None
+        self.last_report = self.started
+        # The explorer and the caches are shared between builds, only what happens during this one is reported
+        self.explorer_baseline = self.get_explorer_stats()
+        self.cache_baseline = self.get_cache_stats()
+
+    def track(self, explorer=None, engine_pool=None):
+        # Builders attach what they create themselves to a profile the caller made without them
+        if explorer is not None and self.explorer is None:
+            self.explorer = explorer
+            self.explorer_baseline = self.get_explorer_stats()
+        if engine_pool is not None and self.engine_pool is None:
+            self.engine_pool = engine_pool
+        self.cache_baseline = self.get_cache_stats()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.timers[name] = self.timers.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def progress(self, pending=None, force=False):
+        # pending is the number of positions known but not expanded yet, it drives the ETA
+        if pending is not None:
+            self.pending = pending
+        now = time.monotonic()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+
+        report = self.get_progress()
+        eta = "?" if report["eta"] is None else f"{report['eta']:.0f}s"
+        logger.info(f"{self.name}: {report['nodes_expanded']} positions expanded, {report['transpositions']} transpositions, {report['pending']} pending, {report['throughput']:.1f} positions/s, ETA {eta}")
+        if self.callback is not None:
+            self.callback(report)
+
+    def get_progress(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        nodes_expanded = self.counters["nodes_expanded"]
+        throughput = nodes_expanded / elapsed if elapsed > 0 else 0.0
+        eta = self.pending / throughput if self.pending is not None and throughput > 0 else None
+        return {
+            "name": self.name,
+            "elapsed": elapsed,
+            "nodes_expanded": nodes_expanded,
+            "transpositions": self.counters["transpositions"],
+            "pending": self.pending,
+            "throughput": throughput,
+            "eta": eta
+        }
+
+    def finish(self):
+        self.pending = 0
+        self.finished = time.monotonic()
+        self.progress(force=True)
+
+    def get_explorer_stats(self):
+        if self.explorer is None or not hasattr(self.explorer, "get_stats"):
+            return {}
+        return self.explorer.get_stats()
+
+    def get_cache_stats(self):
+        # The explorer and the engines usually share one cache, it is only counted once
+        caches = {}
+        for owner in (self.explorer, self.engine_pool):
+            cache = getattr(owner, "cache", None)
+            if cache is not None:
+                caches[id(cache)] = cache
+        stats = {}
+        for cache in caches.values():
+            for name, value in cache.get_stats().items():
+                stats[name] = stats.get(name, 0) + value
+        return stats
+
+    def to_dict(self):
+        explorer_stats = self.get_explorer_stats()
+        cache_stats = self.get_cache_stats()
+        with self.lock:
+            timers = {name: {"seconds": seconds, "calls": self.calls[name]} for name, seconds in self.timers.items()}
+            counters = dict(self.counters)
+
+        counters["requests"] = explorer_stats.get("requests", 0) - self.explorer_baseline.get("requests", 0)
+        counters["throttled"] = explorer_stats.get("throttled", 0) - self.explorer_baseline.get("throttled", 0)
+        counters["retries"] = explorer_stats.get("retries", 0) - self.explorer_baseline.get("retries", 0)
+        counters["cache_hits"] = cache_stats.get("hits", 0) - self.cache_baseline.get("hits", 0)
+        counters["cache_misses"] = cache_stats.get("misses", 0) - self.cache_baseline.get("misses", 0)
+        if "wait_time" in explorer_stats:
+            # Time the explorer workers spent in the rate limiter, 429 pauses and retry backoff
+            timers["throttle_wait"] = {"seconds": explorer_stats["wait_time"] - self.explorer_baseline.get("wait_time", 0.0), "calls": counters["throttled"] + counters["retries"]}
+
+        return {
+            "name": self.name,
+            "progress": self.get_progress(),
+            "timers": timers,
+            "counters": counters
+        }
+
+    def dump(self, filename):
+        with open(filename, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
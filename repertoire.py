@@ -0,0 +1,127 @@
+import chess
+import numpy as np
+
+from binary_tree import decode_move
+from pgn_tree import write_pgn
+from stats import format_comment
+
+# Expected score of a centipawn advantage, the same curve the lichess accuracy uses
+WIN_RATE_SLOPE = 0.00368208
+
+
+class Repertoire:
+    def __init__(self, columns, color, criterion, static, minimax, expectimax, best, order):
+        self.columns = columns
+        self.color = color
+        # The value the best moves are chosen by, "expectimax" or "minimax"
+        self.criterion = criterion
+        # Expected score for color in every position: from the eval alone, against the best replies, and against the replies as often as they are played
+        self.static = static
+        self.minimax = minimax
+        self.expectimax = expectimax
+        # Row of the best move for the side to move, -1 at leaves. The opponent's best move is the one worst for color
+        self.best = best
+        # Rows with every group of siblings sorted from best to worst for the side to move, at the rows of the unsorted group
+        self.order = order
+
+    def get_row(self, node):
+        return self.columns.get_node_index(node)
+
+    def get_best_child(self, row):
+        return self.best[row]
+
+    def get_ordered_children(self, row):
+        start = self.columns.child_start[row]
+        return self.order[start:start + self.columns.child_count[row]]
+
+    def get_value(self, row):
+        return self.expectimax[row] if self.criterion == "expectimax" else self.minimax[row]
+
+    def get_line(self, row=0):
+        # Best play for both sides from the row on
+        line = []
+        row = self.best[row]
+        while row >= 0:
+            line.append(row)
+            row = self.best[row]
+        return line
+
+    def select(self, min_reach=0.01, max_depth=None):
+        # Rows of the pruned repertoire: only the best move of color, and the replies a game reaches at least min_reach of the time
+        columns = self.columns
+        ours = columns.turn == self.color
+        reach = np.zeros(len(columns))
+        reach[0] = 1.0
+        selected = np.zeros(len(columns), dtype=bool)
+        selected[0] = True
+        share = columns.frequency / 100
+        last_depth = columns.depth.max(initial=0) if max_depth is None else min(max_depth, columns.depth.max(initial=0))
+        for level in range(1, int(last_depth) + 1):
+            rows = np.flatnonzero(columns.depth == level)
+            parents = columns.parent[rows]
+            reach[rows] = reach[parents] * np.where(ours[parents], 1.0, share[rows])
+            chosen = np.where(ours[parents], self.best[parents] == rows, reach[rows] >= min_reach)
+            selected[rows] = selected[parents] & chosen
+        return selected, reach
+
+    def write_pgn(self, file, headers, get_statistics, min_reach=0.01, max_depth=None):
+        columns = self.columns
+        selected, reach = self.select(min_reach, max_depth)
+
+        def get_comment(row):
+            return format_comment(get_statistics(columns.nodes[row]), root=row == 0) + f"[rep: {self.expectimax[row]:.3f}, {self.minimax[row]:.3f}, {reach[row]:.4f}]"
+
+        def get_variations(row):
+            return [(decode_move(int(columns.move[child])), get_comment(child), child) for child in self.get_ordered_children(row) if selected[child]]
+
+        write_pgn(file, headers, columns.nodes[0].board(), get_comment(0), get_variations(0), get_variations)
+
+
+def build_repertoire(columns, color, criterion="expectimax"):
+    # One bottom-up pass: the rows of a level are contiguous, so every level is reduced into its parents at once, deepest level first
+    count = len(columns)
+    ours = columns.turn == color
+    static = get_static_scores(columns, color)
+    minimax = static.copy()
+    expectimax = static.copy()
+    best = np.full(count, -1, dtype=np.int32)
+    order = np.arange(count, dtype=np.int32)
+    share = columns.frequency / 100
+
+    level_starts = np.flatnonzero(np.diff(columns.depth)) + 1
+    level_ends = np.append(level_starts[1:], count)
+    for start, end in zip(level_starts[::-1], level_ends[::-1]):
+        rows = np.arange(start, end, dtype=np.int32)
+        parents = columns.parent[start:end]
+        group_starts = np.flatnonzero(np.diff(parents, prepend=-1))
+        group_parents = parents[group_starts]
+        group_ours = ours[group_parents]
+
+        # color picks the best move, the opponent either the worst one for color or one as often as in the games
+        values = minimax[start:end]
+        minimax[group_parents] = np.where(group_ours, np.maximum.reduceat(values, group_starts), np.minimum.reduceat(values, group_starts))
+
+        # Games leaving the tree are scored by the eval of the position they leave from
+        values = expectimax[start:end]
+        covered = np.add.reduceat(share[start:end], group_starts)
+        uncovered = np.clip(1 - covered, 0, None)
+        average = (np.add.reduceat(share[start:end] * values, group_starts) + uncovered * static[group_parents]) / (covered + uncovered)
+        expectimax[group_parents] = np.where(group_ours, np.maximum.reduceat(values, group_starts), average)
+
+        # The side to move prefers the highest value for itself, the first of equal moves wins like in a stable sort
+        values = expectimax[start:end] if criterion == "expectimax" else minimax[start:end]
+        keys = np.where(ours[parents], values, -values)
+        group_sizes = np.diff(np.append(group_starts, end - start))
+        is_best = keys == np.repeat(np.maximum.reduceat(keys, group_starts), group_sizes)
+        best[group_parents] = np.minimum.reduceat(np.where(is_best, rows, count), group_starts)
+        order[start:end] = rows[np.lexsort((-keys, parents))]
+
+    return Repertoire(columns, color, criterion, static, minimax, expectimax, best, order)
+
+
+def get_static_scores(columns, color):
+    # Expected score from the eval, or from the game results where there is no eval
+    white_scores = 1 / (1 + np.exp(-WIN_RATE_SLOPE * 100 * columns.eval))
+    white_scores = np.where(np.isnan(white_scores), columns.white_score, white_scores)
+    white_scores = np.where(np.isnan(white_scores), 0.5, white_scores)
+    return white_scores if color == chess.WHITE else 1 - white_scores
@@ -0,0 +1,110 @@
+import re
+
+OPENING_REGEX = re.compile(r'\[open: (.*?), (.*?)\]')
+PLAYER_REGEX = re.compile(r'\[freq: (\d+), (\d+(?:\.\d+)?)\]\[wdb: (\d+), (\d+), (\d+)\]\[wdb%: (\d+(?:\.\d+)?), (\d+(?:\.\d+)?), (\d+(?:\.\d+)?)\]')
+EVAL_REGEX = re.compile(r'\[%eval ([-+]?\d*\.\d+|\d+),(\d+)\]')
+MATE_REGEX = re.compile(r'\[%eval #([-+]?\d+),(\d+)\]')
+
+
+class NodeStats:
+    __slots__ = ("eco", "openingname", "has_opening", "total_occurrence", "frequency", "white_wins", "draws", "black_wins", "white_percentage", "draw_percentage", "black_percentage", "eval", "mate", "evaldepth")
+
+    def __init__(self, eco="", openingname="", has_opening=False, total_occurrence=0, frequency=0.0, white_wins=0, draws=0, black_wins=0, white_percentage=0.0, draw_percentage=0.0, black_percentage=0.0, eval=None, mate=None, evaldepth=0):
+        self.eco = eco
+        self.openingname = openingname
+        # Whether the opening is named on this node or inherited from an ancestor
+        self.has_opening = has_opening
+        self.total_occurrence = total_occurrence
+        self.frequency = frequency
+        self.white_wins = white_wins
+        self.draws = draws
+        self.black_wins = black_wins
+        self.white_percentage = white_percentage
+        self.draw_percentage = draw_percentage
+        self.black_percentage = black_percentage
+        self.eval = eval
+        # Mate scores are kept so they survive a round trip, but they are not reported as an eval
+        self.mate = mate
+        self.evaldepth = evaldepth
+
+    def to_dict(self):
+        return {
+            "eco": self.eco,
+            "openingname": self.openingname,
+            "total_occurrence": self.total_occurrence,
+            "frequency": float(self.frequency),
+            "white_wins": self.white_wins,
+            "draws": self.draws,
+            "black_wins": self.black_wins,
+            "white_percentage": self.white_percentage,
+            "draw_percentage": self.draw_percentage,
+            "black_percentage": self.black_percentage,
+            "eval": "?" if self.eval is None else self.eval,
+            "evaldepth": 0 if self.eval is None else self.evaldepth
+        }
+
+
+def parse_comment(comment, parent_stats=None):
+    stats = NodeStats()
+
+    opening_match = OPENING_REGEX.search(comment)
+    if opening_match:
+        stats.eco = opening_match.group(1)
+        stats.openingname = opening_match.group(2)
+        stats.has_opening = True
+    elif parent_stats is not None and parent_stats.eco:
+        # Nodes without an opening tag belong to the opening of their parent
+        stats.eco = parent_stats.eco
+        stats.openingname = parent_stats.openingname
+
+    player_match = PLAYER_REGEX.search(comment)
+    if player_match:
+        stats.total_occurrence = int(player_match.group(1))
+        stats.frequency = float(player_match.group(2))
+        stats.white_wins = int(player_match.group(3))
+        stats.draws = int(player_match.group(4))
+        stats.black_wins = int(player_match.group(5))
+        stats.white_percentage = float(player_match.group(6))
+        stats.draw_percentage = float(player_match.group(7))
+        stats.black_percentage = float(player_match.group(8))
+
+    eval_match = EVAL_REGEX.search(comment)
+    if eval_match:
+        stats.eval = float(eval_match.group(1))
+        stats.evaldepth = int(eval_match.group(2))
+    else:
+        mate_match = MATE_REGEX.search(comment)
+        if mate_match:
+            stats.mate = int(mate_match.group(1))
+            stats.evaldepth = int(mate_match.group(2))
+
+    return stats
+
+
+def derive_stats(stats, frequency, parent_stats=None):
+    # Statistics of one path to a shared position: the frequency belongs to the move and the opening may be inherited
+    node_stats = NodeStats(*(getattr(stats, name) for name in NodeStats.__slots__))
+    node_stats.frequency = frequency
+    if not stats.has_opening:
+        if parent_stats is not None and parent_stats.eco:
+            node_stats.eco = parent_stats.eco
+            node_stats.openingname = parent_stats.openingname
+        else:
+            node_stats.eco = ""
+            node_stats.openingname = ""
+    return node_stats
+
+
+def format_comment(stats, root=False):
+    # Same tag order as the builder writes them. The builder writes the frequency of the root as a whole number
+    frequency = int(stats.frequency) if root and stats.frequency == int(stats.frequency) else stats.frequency
+    comment = ""
+    if stats.eval is not None:
+        comment += f'[%eval {stats.eval:.2f},{stats.evaldepth}]'
+    elif stats.mate is not None:
+        comment += f'[%eval #{stats.mate},{stats.evaldepth}]'
+    if stats.has_opening:
+        comment += f'[open: {stats.eco}, {stats.openingname}]'
+    if stats.total_occurrence:
+        comment += f'[freq: {stats.total_occurrence}, {frequency}][wdb: {stats.white_wins}, {stats.draws}, {stats.black_wins}][wdb%: {stats.white_percentage}, {stats.draw_percentage}, {stats.black_percentage}]'
+    return comment
@@ -0,0 +1,66 @@
+import chess
+import chess.engine
+
+from analysis import ReanalysisScheduler
+from benchmark import FAKE_ENGINE, make_synthetic_tree
+from binary_tree import BINARY_EXTENSION
+from engine import EnginePool
+from opening import OpeningTree
+
+
+class FixedDepthCache:
+    # Every position is already known at the same depth, like a cache filled by an engine with a depth cap
+    def __init__(self, depth):
+        self.depth = depth
+        self.hits = 0
+
+    def get_eval(self, board, limit):
+        self.hits += 1
+        return chess.engine.PovScore(chess.engine.Cp(20), chess.WHITE), self.depth
+
+    def set_eval(self, board, limit, eval):
+        pass
+
+    def get_stats(self):
+        return {"hits": self.hits}
+
+
+def test_scheduler_stops_when_the_depth_does_not_grow():
+    opening_tree = make_synthetic_tree(3, 3)
+    for stats in opening_tree.node_stats.values():
+        stats.evaldepth = 5
+    cache = FixedDepthCache(12)
+    with EnginePool(engine_path=FAKE_ENGINE, size=1, cache=cache) as engine_pool:
+        scheduler = ReanalysisScheduler(opening_tree, engine_pool, cpu_budget=10 ** 6, max_depth=30)
+        scheduler.run()
+
+    # The first answer is deeper than the tree and is queued again, the second one is not deeper so the position is done
+    positions = len(opening_tree.position_index)
+    assert scheduler.analysed == 2 * positions
+    assert scheduler.cpu_time == 0
+    assert all(opening_tree.get_node_statistics(node).evaldepth == 12 for node, _, _, _ in opening_tree.preorder())
+
+
+def test_scheduler_deepens_up_to_the_maximum_depth():
+    opening_tree = make_synthetic_tree(2, 2)
+    for stats in opening_tree.node_stats.values():
+        stats.evaldepth = 10
+    with EnginePool(engine_path=FAKE_ENGINE, size=2) as engine_pool:
+        scheduler = ReanalysisScheduler(opening_tree, engine_pool, cpu_budget=10 ** 6, depth_step=2, max_depth=14)
+        scheduler.run()
+    assert all(opening_tree.get_node_statistics(node).evaldepth == 14 for node, _, _, _ in opening_tree.preorder())
+
+
+def test_reach_does_not_expand_lazy_trees(tmp_path):
+    filename = str(tmp_path / ("tree" + BINARY_EXTENSION))
+    make_synthetic_tree(3, 3).save_opening_tree(filename)
+    opening_tree = OpeningTree()
+    opening_tree.load_opening_tree(filename)
+    first_move = opening_tree.game.variations[0]
+
+    scheduler = ReanalysisScheduler(opening_tree, engine_pool=object())
+    reach = scheduler.get_reach_probabilities()
+    # The root and its children were loaded, the grandchildren were not
+    assert len(reach) == 4
+    assert first_move._tree_source is not None
+    opening_tree.close_tree_file()
@@ -0,0 +1,69 @@
+import os
+import re
+import chess
+
+from binary_tree import BINARY_EXTENSION, decode_move, encode_move
+from opening import OpeningTree
+
+TREE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Trees", "masters_10000.pgn")
+
+
+def load(filename):
+    opening_tree = OpeningTree()
+    opening_tree.load_opening_tree(filename)
+    return opening_tree
+
+
+def read_moves(filename):
+    # The binary format keeps the moves and their statistics, not the headers. Lines are wrapped, so only the tokens are compared
+    with open(filename, 'r') as file:
+        return " ".join(file.read().split("\n\n", 1)[1].split())
+
+
+def convert(filename, tmp_path, name):
+    # Through the binary format and back to PGN
+    binary_file = str(tmp_path / (name + BINARY_EXTENSION))
+    pgn_file = str(tmp_path / (name + ".pgn"))
+    load(filename).save_opening_tree(binary_file)
+    opening_tree = load(binary_file)
+    opening_tree.save_opening_tree(pgn_file)
+    opening_tree.close_tree_file()
+    return pgn_file
+
+
+def test_binary_round_trip(tmp_path):
+    first_file = convert(TREE_FILE, tmp_path, "first")
+    # Transposed positions are stored once, so they keep the eval of the first path while the file analysed every path
+    assert re.sub(r"\[%eval [^]]*\]", "", read_moves(first_file)) == re.sub(r"\[%eval [^]]*\]", "", read_moves(TREE_FILE))
+    assert read_moves(convert(first_file, tmp_path, "second")) == read_moves(first_file)
+
+
+def test_binary_nodes_are_read_when_visited(tmp_path):
+    binary_file = str(tmp_path / ("masters" + BINARY_EXTENSION))
+    original = load(TREE_FILE)
+    original.save_opening_tree(binary_file)
+
+    opening_tree = load(binary_file)
+    child_node = opening_tree.game.variations[0]
+    assert child_node._tree_source is not None
+    assert opening_tree.get_node_information(child_node) == original.get_node_information(original.game.variations[0])
+    assert [variation.move for variation in child_node.variations] == [variation.move for variation in original.game.variations[0].variations]
+    assert child_node._tree_source is None
+    opening_tree.close_tree_file()
+
+
+def test_saving_over_the_mapped_file(tmp_path):
+    binary_file = str(tmp_path / ("masters" + BINARY_EXTENSION))
+    load(TREE_FILE).save_opening_tree(binary_file)
+
+    opening_tree = load(binary_file)
+    opening_tree.save_opening_tree(binary_file)
+    opening_tree.close_tree_file()
+    pgn_file = str(tmp_path / "masters.pgn")
+    load(binary_file).save_opening_tree(pgn_file)
+    assert read_moves(pgn_file) == read_moves(convert(TREE_FILE, tmp_path, "converted"))
+
+
+def test_move_codes():
+    for move in [chess.Move.from_uci("e2e4"), chess.Move.from_uci("a7a8q"), chess.Move.from_uci("h2h1n"), chess.Move.from_uci("e1g1")]:
+        assert decode_move(encode_move(move)) == move
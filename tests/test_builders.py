@@ -0,0 +1,126 @@
+import pytest
+
+from benchmark import FAKE_ENGINE, StubExplorerServer
+from engine import EnginePool
+from explorer import ExplorerClient
+from opening import OpeningTree
+
+# Small enough to build in a moment, the stub answers give 110 positions with 10 transpositions
+BREADTH = 3
+GAMES = 10 ** 6
+MIN_OCCURRENCES = 3000
+
+
+@pytest.fixture(scope="module")
+def server():
+    with StubExplorerServer(BREADTH, GAMES) as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def engine_pool():
+    with EnginePool(engine_path=FAKE_ENGINE, size=2) as engine_pool:
+        yield engine_pool
+
+
+@pytest.fixture
+def explorer():
+    with ExplorerClient(rate=10 ** 6, burst=10 ** 6, cache=None) as explorer:
+        yield explorer
+
+
+def save(opening_tree, tmp_path, name):
+    filename = str(tmp_path / name)
+    opening_tree.save_opening_tree(filename)
+    with open(filename, 'r') as file:
+        return file.read()
+
+
+def test_depth_and_breadth_first_builds_agree(server, engine_pool, explorer, tmp_path):
+    depth_first = OpeningTree()
+    depth_first.build_opening_tree(server.url, min_occurrences=MIN_OCCURRENCES, engine_time=0.01, engine_pool=engine_pool, explorer=explorer)
+    breadth_first = OpeningTree()
+    breadth_first.build_opening_tree_breadth_first(server.url, MIN_OCCURRENCES, 0.01, engine_pool, explorer)
+    assert save(depth_first, tmp_path, "depth_first.pgn") == save(breadth_first, tmp_path, "breadth_first.pgn")
+
+
+def test_transpositions_are_expanded_once(server, engine_pool, explorer):
+    opening_tree = OpeningTree()
+    opening_tree.build_opening_tree_breadth_first(server.url, MIN_OCCURRENCES, 0.01, engine_pool, explorer)
+    counters = opening_tree.build_profile.to_dict()["counters"]
+    assert counters["nodes_expanded"] == 111
+    assert counters["transpositions"] == 10
+    assert counters["requests"] == 111
+
+    # Both move orders lead to the same shared position
+    opening_tree.index_positions()
+    transposed = [nodes for nodes in opening_tree.position_index.values() if len(nodes) > 1]
+    assert len(transposed) == 10
+    for nodes in transposed:
+        assert len({opening_tree.get_node_statistics(node).total_occurrence for node in nodes}) == 1
+
+
+class FailingExplorer:
+    # Loses the connection after a number of answers, like a build interrupted halfway
+    def __init__(self, explorer, answers):
+        self.explorer = explorer
+        self.answers = answers
+        self.concurrency = 1
+
+    def get_position_info(self, fen, url):
+        if self.answers <= 0:
+            raise ConnectionError("explorer unreachable")
+        self.answers -= 1
+        return self.explorer.get_position_info(fen, url)
+
+
+def test_resumed_build_matches_an_uninterrupted_one(server, engine_pool, explorer, tmp_path):
+    checkpoint_file = str(tmp_path / "build.checkpoint")
+    interrupted = OpeningTree()
+    with pytest.raises(ConnectionError):
+        interrupted.build_opening_tree_breadth_first(server.url, MIN_OCCURRENCES, 0.01, engine_pool, FailingExplorer(explorer, 50), checkpoint_file)
+
+    resumed = OpeningTree()
+    resumed.resume_opening_tree(checkpoint_file, engine_pool, explorer)
+    # Only the positions that were not expanded before the interruption are queried again
+    assert resumed.build_profile.to_dict()["counters"]["nodes_expanded"] == 111 - 50
+
+    complete = OpeningTree()
+    complete.build_opening_tree_breadth_first(server.url, MIN_OCCURRENCES, 0.01, engine_pool, explorer)
+    assert save(resumed, tmp_path, "resumed.pgn") == save(complete, tmp_path, "complete.pgn")
+
+
+def test_refresh_matches_a_fresh_build(server, engine_pool, explorer, tmp_path):
+    built = OpeningTree()
+    built.build_opening_tree_breadth_first(server.url, MIN_OCCURRENCES, 0.01, engine_pool, explorer)
+    built_file = str(tmp_path / "built.pgn")
+    built.save_opening_tree(built_file)
+
+    opening_tree = OpeningTree()
+    opening_tree.load_opening_tree(built_file)
+    # An eval the refresh has to keep instead of analysing the position again
+    node = opening_tree.game.variations[0]
+    stats = opening_tree.get_node_statistics(node)
+    eval, stats.eval = stats.eval, 9.99
+
+    # Twice the games and one more move per position: every count changes and new moves qualify
+    with StubExplorerServer(BREADTH + 1, 2 * GAMES) as grown:
+        opening_tree.refresh_opening_tree(grown.url, MIN_OCCURRENCES, 0.01, engine_pool=engine_pool, explorer=explorer)
+        counters = opening_tree.build_profile.to_dict()["counters"]
+        fresh = OpeningTree()
+        fresh.build_opening_tree_breadth_first(grown.url, MIN_OCCURRENCES, 0.01, engine_pool, explorer)
+
+        assert counters["refreshed"] == 111 and counters["new_positions"] > 0
+        assert counters["evals_deepened"] == 0
+        position = opening_tree.graph.get(node.board().fen())
+        assert position.stats.eval == 9.99 and position.stats.total_occurrence > stats.total_occurrence
+        position.stats.eval = eval
+        assert save(opening_tree, tmp_path, "refreshed.pgn") == save(fresh, tmp_path, "fresh.pgn")
+
+        # Nothing changed since, only the evals are searched deeper
+        opening_tree.refresh_opening_tree(grown.url, MIN_OCCURRENCES, 0.01, eval_depth=25, engine_pool=engine_pool, explorer=explorer)
+    counters = opening_tree.build_profile.to_dict()["counters"]
+    positions = opening_tree.graph.get_reachable_positions(opening_tree.graph_root)
+    assert (counters["refreshed"], counters["unchanged"], counters["new_positions"]) == (0, 1, 0)
+    assert counters["evals_deepened"] == len(positions)
+    assert all(position.stats.evaldepth == 25 for position in positions)
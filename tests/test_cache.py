@@ -0,0 +1,79 @@
+import chess
+import chess.engine
+
+from cache import ResultCache, dump_score, get_explorer_key, load_score
+
+URL = "https://explorer.lichess.ovh/masters"
+FEN = "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2"
+POSITION_INFO = {"white": 3, "draws": 2, "black": 1, "moves": []}
+
+
+def make_cache(tmp_path, **kwargs):
+    return ResultCache(str(tmp_path / "cache.sqlite"), **kwargs)
+
+
+def age(result_cache, table, seconds):
+    # Entries as if they had been written that long ago
+    with result_cache.lock:
+        result_cache.connection.execute(f"UPDATE {table} SET created = created - ?", (seconds,))
+        result_cache.connection.commit()
+
+
+def test_entries_expire(tmp_path):
+    result_cache = make_cache(tmp_path, explorer_ttl=60, eval_ttl=None)
+    board = chess.Board(FEN)
+    limit = chess.engine.Limit(time=0.1)
+    result_cache.set_position_info(FEN, URL, POSITION_INFO)
+    result_cache.set_eval(board, limit, (chess.engine.PovScore(chess.engine.Cp(25), chess.WHITE), 20))
+
+    age(result_cache, "explorer", 120)
+    age(result_cache, "evals", 10 ** 6)
+    assert result_cache.get_position_info(FEN, URL) is None
+    # Evals without a TTL never expire
+    assert result_cache.get_eval(board, limit)[1] == 20
+    assert result_cache.get_stats() == {"hits": 1, "misses": 1, "writes": 2}
+
+    # Expired rows are deleted on eviction
+    result_cache.evict()
+    assert result_cache.connection.execute("SELECT COUNT(*) FROM explorer").fetchone()[0] == 0
+    result_cache.close()
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    result_cache = make_cache(tmp_path, explorer_ttl=None, max_entries=3)
+    fens = []
+    board = chess.Board()
+    for move in ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5"]:
+        board.push_uci(move)
+        fens.append(board.fen())
+        age(result_cache, "explorer", 1)
+        result_cache.set_position_info(fens[-1], URL, POSITION_INFO)
+
+    result_cache.evict()
+    assert [result_cache.get_position_info(fen, URL) is not None for fen in fens] == [False, False, True, True, True]
+    result_cache.close()
+
+
+def test_scores_round_trip():
+    scores = [chess.engine.Cp(35), chess.engine.Cp(-120), chess.engine.Mate(3), chess.engine.Mate(-2), chess.engine.MateGiven]
+    for turn in (chess.WHITE, chess.BLACK):
+        for score in scores:
+            pov_score = chess.engine.PovScore(score, turn)
+            loaded = load_score(dump_score(pov_score), turn)
+            assert loaded == pov_score
+            assert loaded.white() == pov_score.white()
+    assert dump_score(chess.engine.PovScore(chess.engine.Cp(35), chess.BLACK)) == "cp 35"
+    assert dump_score(chess.engine.PovScore(chess.engine.Mate(-2), chess.WHITE)) == "mate -2"
+
+
+def test_explorer_keys_ignore_counters_and_impossible_en_passant():
+    key = get_explorer_key(FEN, URL)
+    # Different move counters and no en passant square: no pawn can take on e6
+    assert get_explorer_key("rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 5 9", URL) == key
+    assert get_explorer_key(FEN, URL, {"moves": 12, "since": 1952}) == get_explorer_key(FEN, URL, {"since": 1952, "moves": 12})
+    assert get_explorer_key(FEN, URL, {"moves": 12}) != key
+    assert get_explorer_key(FEN, URL + "?variant=standard") != key
+
+    # A possible en passant capture is a different position
+    en_passant = "rnbqkbnr/ppp1pppp/8/8/2Pp4/8/PP1PPPPP/RNBQKBNR b KQkq c3 0 3"
+    assert get_explorer_key(en_passant, URL) != get_explorer_key(en_passant.replace(" c3 ", " - "), URL)
@@ -0,0 +1,58 @@
+import math
+import chess
+import numpy as np
+
+from benchmark import make_synthetic_tree
+from columns import MATE_EVAL, get_eval
+from stats import NodeStats
+
+
+def get_reach(opening_tree):
+    reach = {opening_tree.game: 1.0}
+    for node, depth, _, _ in opening_tree.preorder(opening_tree.game):
+        if depth:
+            reach[node] = reach[node.parent] * opening_tree.get_node_statistics(node).frequency / 100
+    return reach
+
+
+def test_columns_follow_the_tree():
+    opening_tree = make_synthetic_tree(3, 3)
+    columns = opening_tree.get_columns()
+    reach = get_reach(opening_tree)
+    assert len(columns) == len(reach)
+    for row, node in enumerate(columns.nodes):
+        assert math.isclose(columns.reach[row], reach[node])
+        assert [columns.nodes[child] for child in columns.get_children(row)] == node.variations
+        assert columns.get_moves(row) == node.board().move_stack
+        assert columns.occurrences[row] == opening_tree.get_node_statistics(node).total_occurrence
+    assert columns.turn[0] == chess.WHITE and columns.turn[columns.get_children(0)[0]] == chess.BLACK
+
+
+def test_subtree_and_depth_limit():
+    opening_tree = make_synthetic_tree(3, 3)
+    node = opening_tree.game.variations[1]
+    columns = opening_tree.get_columns(node, max_depth=1)
+    assert columns.nodes == [node] + node.variations
+    assert columns.turn[0] == chess.BLACK
+    assert columns.get_san(1, node.board()) == node.board().variation_san([node.variations[0].move])
+
+
+def test_queries():
+    opening_tree = make_synthetic_tree(3, 3)
+    columns = opening_tree.get_columns()
+    mask = columns.filter(min_depth=2, turn=chess.WHITE)
+    assert set(columns.depth[mask]) == {2}
+
+    rows = columns.top_k(columns.reach, 5, mask)
+    assert len(rows) == 5 and mask[rows].all()
+    assert list(columns.reach[rows]) == sorted(columns.reach[mask], reverse=True)[:5]
+
+    best_child = columns.get_best_child(0, columns.frequency)
+    assert columns.frequency[best_child] == max(opening_tree.get_node_statistics(node).frequency for node in opening_tree.game.variations)
+
+
+def test_mates_rank_above_every_eval():
+    assert get_eval(NodeStats(mate=3)) == MATE_EVAL - 3
+    assert get_eval(NodeStats(mate=1)) > get_eval(NodeStats(mate=3)) > get_eval(NodeStats(eval=99.0))
+    assert get_eval(NodeStats(mate=-1)) < get_eval(NodeStats(mate=-3)) < get_eval(NodeStats(eval=-99.0))
+    assert np.isnan(get_eval(NodeStats()))
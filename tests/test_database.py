@@ -0,0 +1,50 @@
+import io
+import chess.pgn
+
+from database import read_game_chunks, read_pgn_database
+
+GAMES = """[Event "First"]
+[Result "1-0"]
+
+1. e4 { a long comment
+[%eval 0.3] } e5 2. Nf3
+[%clk 0:01:00] Nc6 1-0
+
+[Event "Second"]
+[Result "0-1"]
+
+1. d4 d5 0-1
+
+[Event "Third"]
+[Result "1/2-1/2"]
+
+1. e4 c5 1/2-1/2
+"""
+
+
+def write_games(tmp_path):
+    filename = str(tmp_path / "games.pgn")
+    with open(filename, 'w') as file:
+        file.write(GAMES)
+    return filename
+
+
+def test_chunks_split_only_on_tag_pairs(tmp_path):
+    chunks = list(read_game_chunks([write_games(tmp_path)], 1))
+    assert len(chunks) == 3
+    games = [chess.pgn.read_game(io.StringIO(chunk)) for chunk in chunks]
+    assert [game.headers["Event"] for game in games] == ["First", "Second", "Third"]
+    assert [move.uci() for move in games[0].mainline_moves()] == ["e2e4", "e7e5", "g1f3", "b8c6"]
+
+
+def test_chunks_keep_every_game(tmp_path):
+    chunks = list(read_game_chunks([write_games(tmp_path)], 2))
+    assert len(chunks) == 2
+    assert "".join(chunks) == GAMES
+
+
+def test_database_counts_every_game(tmp_path):
+    explorer = read_pgn_database(write_games(tmp_path), max_ply=4, processes=1, games_per_chunk=1)
+    position_info = explorer.get_position_info(chess.Board().fen())
+    assert (position_info["white"], position_info["draws"], position_info["black"]) == (1, 1, 1)
+    assert sorted(move["uci"] for move in position_info["moves"]) == ["d2d4", "e2e4"]
@@ -0,0 +1,34 @@
+import chess
+import chess.engine
+
+from benchmark import FAKE_ENGINE
+from engine import EnginePool
+
+
+class RecordingCache:
+    # Answers every lookup and remembers the boards it was asked about
+    def __init__(self):
+        self.boards = []
+
+    def get_eval(self, board, limit):
+        self.boards.append(board)
+        return chess.engine.PovScore(chess.engine.Cp(0), chess.WHITE), 20
+
+    def set_eval(self, board, limit, eval):
+        pass
+
+
+def test_submitted_boards_keep_their_moves():
+    board = chess.Board()
+    for move in ["g1f3", "g8f6", "f3g1", "f6g8", "g1f3", "g8f6", "f3g1"]:
+        board.push_uci(move)
+    cache = RecordingCache()
+    with EnginePool(engine_path=FAKE_ENGINE, size=1, cache=cache) as engine_pool:
+        engine_pool.submit(board, chess.engine.Limit(depth=10)).result()
+        board.push_uci("f6g8")
+
+    # The engine sees the position could be repeated a third time, and the caller's later moves do not leak into the copy
+    analysed = cache.boards[0]
+    assert analysed is not board
+    assert len(analysed.move_stack) == 7
+    assert analysed.can_claim_threefold_repetition()
@@ -0,0 +1,152 @@
+import email.utils
+import json
+import socket
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmark import get_stub_position_info
+from explorer import ExplorerClient, ExplorerConnectionError, ExplorerHTTPError, ExplorerRateLimitError, TokenBucket
+
+FEN = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+
+
+class ScriptedServer:
+    # Answers with the given (status, headers) in order, then like the stub explorer
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        scripted = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with scripted.lock:
+                    scripted.requests += 1
+                    status, headers = scripted.answers.pop(0) if scripted.answers else (200, {})
+                body = json.dumps(get_stub_position_info(FEN) if status == 200 else {"error": "scripted"}).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/masters"
+        self.thread = threading.Thread(target=self.server.serve_forever, name="scripted-explorer", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def make_client(max_retries=3):
+    return ExplorerClient(rate=10 ** 6, burst=10 ** 6, timeout=2, max_retries=max_retries, backoff=0.01, max_backoff=0.02, cache=None)
+
+
+def get_closed_url():
+    # A port nothing listens on
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/masters"
+
+
+def test_retry_after_in_seconds():
+    with ScriptedServer([(429, {"Retry-After": "0.3"})]) as server, make_client() as client:
+        start = time.monotonic()
+        assert client.get_position_info(FEN, server.url) == get_stub_position_info(FEN)
+        assert time.monotonic() - start >= 0.3
+        stats = client.get_stats()
+        assert (stats["requests"], stats["throttled"], stats["retries"], stats["errors"]) == (2, 1, 1, 0)
+        assert stats["wait_time"] >= 0.25
+        # The limiter slows down after being throttled
+        assert client.limiter.rate < client.limiter.max_rate
+
+
+def test_retry_after_as_an_http_date():
+    retry_date = email.utils.formatdate(time.time() + 1.5, usegmt=True)
+    with ScriptedServer([(429, {"Retry-After": retry_date})]) as server, make_client() as client:
+        start = time.monotonic()
+        client.get_position_info(FEN, server.url)
+        assert 0.4 <= time.monotonic() - start < 3
+        assert client.get_stats()["throttled"] == 1
+
+
+def test_server_errors_are_retried_up_to_the_limit():
+    with ScriptedServer([(500, {})] * 2) as server, make_client() as client:
+        client.get_position_info(FEN, server.url)
+        assert client.get_stats()["retries"] == 2
+
+    with ScriptedServer([(503, {})] * 10) as server, make_client(max_retries=2) as client:
+        with pytest.raises(ExplorerHTTPError) as error:
+            client.get_position_info(FEN, server.url)
+        assert error.value.status_code == 503 and not isinstance(error.value, ExplorerRateLimitError)
+        assert server.requests == 3
+        stats = client.get_stats()
+        assert (stats["requests"], stats["retries"], stats["errors"]) == (3, 2, 1)
+
+
+def test_throttling_past_the_limit_is_a_rate_limit_error():
+    with ScriptedServer([(429, {"Retry-After": "0"})] * 10) as server, make_client(max_retries=1) as client:
+        with pytest.raises(ExplorerRateLimitError) as error:
+            client.get_position_info(FEN, server.url)
+        assert error.value.status_code == 429
+        assert client.get_stats()["throttled"] == 2
+
+
+def test_client_errors_are_not_retried():
+    with ScriptedServer([(404, {})]) as server, make_client() as client:
+        with pytest.raises(ExplorerHTTPError) as error:
+            client.get_position_info(FEN, server.url)
+        assert error.value.status_code == 404
+        assert server.requests == 1
+        stats = client.get_stats()
+        assert (stats["requests"], stats["retries"], stats["errors"]) == (1, 0, 1)
+
+
+def test_connection_failures():
+    with make_client(max_retries=2) as client:
+        with pytest.raises(ExplorerConnectionError):
+            client.get_position_info(FEN, get_closed_url())
+        stats = client.get_stats()
+        assert (stats["requests"], stats["retries"], stats["errors"], stats["throttled"]) == (3, 2, 1, 0)
+
+
+def test_token_bucket():
+    limiter = TokenBucket(rate=20, capacity=2, min_rate=5)
+    # The burst is free, then tokens come at the rate
+    assert limiter.acquire() == 0 and limiter.acquire() == 0
+    assert 0.02 <= limiter.acquire() <= 0.2
+
+    # Throttling holds every caller and halves the rate, never below min_rate
+    limiter.pause(0.2)
+    assert limiter.rate == 10
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.19
+    limiter.pause(0)
+    limiter.pause(0)
+    assert limiter.rate == 5
+
+    for _ in range(1000):
+        limiter.reward()
+    assert limiter.rate == 20
@@ -0,0 +1,117 @@
+import time
+import chess
+
+from benchmark import FAKE_ENGINE, StubExplorerServer, get_stub_position_info
+from engine import EnginePool
+from explorer import ExplorerClient
+from live import LiveExpander
+from opening import OpeningTree
+
+
+class FlakyExplorer:
+    # Fails the first requests like a lost connection, then answers like the stub server
+    def __init__(self, failures):
+        self.failures = failures
+
+    def get_position_info(self, fen, url=None):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("explorer unreachable")
+        return get_stub_position_info(fen)
+
+
+def wait_for(expander, condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        expander.apply_updates()
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def make_tree(min_occurrences=None):
+    opening_tree = OpeningTree()
+    if min_occurrences is not None:
+        opening_tree.game.headers["MinOccurrences"] = str(min_occurrences)
+    return opening_tree
+
+
+def test_threshold_comes_from_the_tree():
+    with EnginePool(engine_path=FAKE_ENGINE, size=1) as engine_pool:
+        with LiveExpander(make_tree(500), engine_pool=engine_pool, explorer=FlakyExplorer(0)) as expander:
+            assert expander.min_occurrences == 500
+            assert expander.thin_min_occurrences == 50
+
+
+def test_threshold_of_a_tree_without_the_header():
+    opening_tree = make_tree()
+    opening_tree.add_children(opening_tree.game, [(chess.Move.from_uci("e2e4"), 60.0, opening_tree.get_position_statistics({"white": 300, "draws": 200, "black": 100, "moves": []}, None)),
+                                                  (chess.Move.from_uci("d2d4"), 40.0, opening_tree.get_position_statistics({"white": 200, "draws": 100, "black": 100, "moves": []}, None))])
+    assert opening_tree.get_min_occurrences() == 400
+
+
+def test_failed_fetch_is_retried():
+    opening_tree = make_tree(1000)
+    with EnginePool(engine_path=FAKE_ENGINE, size=1) as engine_pool:
+        with LiveExpander(opening_tree, engine_pool=engine_pool, explorer=FlakyExplorer(1), retry_interval=0.2) as expander:
+            assert expander.request(opening_tree.game)
+            assert wait_for(expander, lambda: opening_tree.game not in expander.requested)
+            assert not opening_tree.game.variations
+            assert not expander.request(opening_tree.game)
+
+            time.sleep(0.2)
+            assert expander.request(opening_tree.game)
+            assert wait_for(expander, lambda: opening_tree.game.variations)
+
+
+def test_thin_branches_get_their_missing_moves():
+    opening_tree = make_tree(3 * 10 ** 5)
+    with StubExplorerServer() as server, ExplorerClient(cache=None) as explorer:
+        with EnginePool(engine_path=FAKE_ENGINE, size=1) as engine_pool:
+            with LiveExpander(opening_tree, url=server.url, engine_pool=engine_pool, explorer=explorer) as expander:
+                assert expander.request(opening_tree.game)
+                assert wait_for(expander, lambda: opening_tree.game.variations)
+                known_moves = [variation.move for variation in opening_tree.game.variations]
+                assert expander.is_thin(opening_tree.game)
+
+                # Browsing to the node only expands leaves, hovering it fills in the rarer moves
+                expander.requested.discard(opening_tree.game)
+                assert not expander.request(opening_tree.game)
+                assert expander.request(opening_tree.game, thin=True)
+                assert wait_for(expander, lambda: len(opening_tree.game.variations) > len(known_moves))
+
+    moves = [variation.move for variation in opening_tree.game.variations]
+    assert moves[:len(known_moves)] == known_moves
+    assert len(set(moves)) == len(moves)
+
+
+def test_tree_is_saved_off_the_event_loop(tmp_path):
+    opening_tree = make_tree(1000)
+    saves = []
+
+    def save_opening_tree(filename):
+        # As slow as writing a large tree
+        time.sleep(0.5)
+        saves.append(len(opening_tree.game.variations))
+
+    opening_tree.save_opening_tree = save_opening_tree
+    with EnginePool(engine_path=FAKE_ENGINE, size=1) as engine_pool:
+        with LiveExpander(opening_tree, engine_pool=engine_pool, explorer=FlakyExplorer(0), save_file=str(tmp_path / "live.pgn"), save_interval=0) as expander:
+            assert expander.request(opening_tree.game)
+            assert wait_for(expander, lambda: expander.is_saving())
+            assert not saves
+
+            # Results that arrive during the save wait until it is done
+            node = opening_tree.game.variations[0]
+            assert expander.request(node)
+            assert wait_for(expander, lambda: not expander.results.empty())
+            start = time.monotonic()
+            assert not expander.apply_updates()
+            assert time.monotonic() - start < 0.1
+            assert not node.variations and expander.is_saving()
+
+            expander.wait_for_save()
+            assert saves == [len(opening_tree.game.variations)]
+            assert expander.apply_updates() and node.variations
+    assert len(saves) == 2 and not expander.unsaved
@@ -0,0 +1,86 @@
+import io
+import os
+import chess.pgn
+
+from opening import OpeningTree
+from pgn_tree import read_pgn_tree
+
+TREE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Trees", "masters_10000.pgn")
+
+
+def load(filename):
+    opening_tree = OpeningTree()
+    opening_tree.load_opening_tree(filename)
+    return opening_tree
+
+
+def read(filename):
+    with open(filename, 'r') as file:
+        return file.read()
+
+
+def export(text):
+    # The game as python-chess writes it to a file, in lines of 80 characters
+    output = io.StringIO()
+    chess.pgn.read_game(io.StringIO(text)).accept(chess.pgn.FileExporter(output))
+    return output.getvalue()
+
+
+def test_save_load_save_round_trip(tmp_path):
+    first_file = str(tmp_path / "first.pgn")
+    second_file = str(tmp_path / "second.pgn")
+    load(TREE_FILE).save_opening_tree(first_file)
+    load(first_file).save_opening_tree(second_file)
+
+    first = read(first_file)
+    assert first == read(second_file)
+    assert first == export(read(TREE_FILE))
+    assert max(len(line) for line in first.splitlines()) < 200
+
+
+def test_statistics_are_kept_once():
+    opening_tree = load(TREE_FILE)
+    node = opening_tree.game.variations[0].variations[0]
+    assert node.comment == "" and opening_tree.get_node_statistics(node).total_occurrence > 0
+
+    # The same statistics as a game read by python-chess with the comments on its nodes
+    parsed = OpeningTree()
+    parsed.game = chess.pgn.read_game(io.StringIO(read(TREE_FILE)))
+    parsed.index_statistics()
+    assert [stats.to_dict() for stats in parsed.node_stats.values()] == [opening_tree.get_node_statistics(node).to_dict() for node in parsed.node_stats]
+
+
+def test_index_statistics_keeps_the_loaded_statistics():
+    opening_tree = load(TREE_FILE)
+    before = {node: stats.to_dict() for node, stats in opening_tree.node_stats.items()}
+    opening_tree.index_statistics()
+    assert {node: stats.to_dict() for node, stats in opening_tree.node_stats.items()} == before
+
+
+def test_tokens_and_comments_across_chunks():
+    text = read(TREE_FILE)
+    node_stats = {}
+    expected = str(read_pgn_tree(io.StringIO(text), node_stats))
+    expected_stats = [stats.to_dict() for stats in node_stats.values()]
+    for chunk_size in (1, 7, 100):
+        node_stats = {}
+        assert str(read_pgn_tree(io.StringIO(text), node_stats, chunk_size)) == expected
+        assert [stats.to_dict() for stats in node_stats.values()] == expected_stats
+
+
+def test_root_frequency_is_a_float():
+    opening_tree = load(TREE_FILE)
+    frequency = opening_tree.get_node_information(opening_tree.game)["frequency"]
+    assert isinstance(frequency, float) and frequency == 100
+
+
+def test_multiline_comments_and_variations():
+    text = "[Event \"?\"]\n\n{ [%eval 0.25,12]\n[freq: 10, 100][wdb: 4, 3, 3][wdb%: 40.0, 30.0, 30.0] } 1. e4 { [freq: 6, 60.0][wdb: 3, 2, 1][wdb%: 50.0, 33.33, 16.67] } ( 1. d4 ) 1... e5 *\n"
+    node_stats = {}
+    game = read_pgn_tree(io.StringIO(text), node_stats)
+    assert [variation.move.uci() for variation in game.variations] == ["e2e4", "d2d4"]
+    assert game.variations[0].variations[0].move.uci() == "e7e5"
+    assert node_stats[game].total_occurrence == 10
+    assert node_stats[game].eval == 0.25
+    assert node_stats[game.variations[0]].white_wins == 3
+    assert node_stats[game.variations[0]].frequency == 60.0
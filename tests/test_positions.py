@@ -0,0 +1,107 @@
+import chess
+
+from benchmark import make_synthetic_tree
+from binary_tree import BINARY_EXTENSION
+from opening import OpeningTree
+from positions import build_position_graph, get_fen_key, get_position_key
+
+TRANSPOSED_FEN = "rnbqkb1r/pppppppp/5n2/8/8/2N2N2/PPPPPPPP/R1BQKB1R b KQkq - 3 2"
+
+
+def add_line(node, moves):
+    for move in moves:
+        node = node.add_variation(chess.Move.from_uci(move))
+    return node
+
+
+def make_transposed_tree():
+    opening_tree = OpeningTree()
+    first = add_line(opening_tree.game, ["g1f3", "g8f6", "b1c3"])
+    second = add_line(opening_tree.game, ["b1c3", "g8f6", "g1f3"])
+    return opening_tree, first, second
+
+
+def test_transpositions_are_found_by_position():
+    opening_tree, first, second = make_transposed_tree()
+    assert set(opening_tree.find_nodes(TRANSPOSED_FEN)) == {first, second}
+    paths = {" ".join(move.uci() for move in path) for path in opening_tree.find_paths(TRANSPOSED_FEN)}
+    assert paths == {"g1f3 g8f6 b1c3", "b1c3 g8f6 g1f3"}
+    assert opening_tree.find_nodes(chess.Board().fen()) == [opening_tree.game]
+
+
+def test_typed_fen_with_other_counters_is_found():
+    opening_tree = OpeningTree()
+    first = add_line(opening_tree.game, ["e2e4", "e7e5", "g1f3", "b8c6"])
+    second = add_line(opening_tree.game, ["g1f3", "b8c6", "e2e4", "e7e5"])
+    assert set(opening_tree.find_nodes("r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 0 1")) == {first, second}
+    assert opening_tree.get_node_key(first) == opening_tree.get_node_key(second)
+
+
+def count_loaded(opening_tree):
+    return sum(1 for _ in opening_tree.preorder(opening_tree.game, loaded_only=True))
+
+
+def test_lazy_trees_are_searched_without_expanding_them(tmp_path):
+    original = make_synthetic_tree(5, 4)
+    # A deep node reached by more than one move order if there is one, else any deep node
+    target = max((nodes for nodes in original.position_index.values()), key=lambda nodes: (len(nodes), nodes[0].ply()))[0]
+    fen = target.board().fen()
+    expected = {" ".join(move.uci() for move in path) for path in original.find_paths(fen)}
+
+    binary_file = str(tmp_path / ("synthetic" + BINARY_EXTENSION))
+    original.save_opening_tree(binary_file)
+    file_tree = OpeningTree()
+    file_tree.load_opening_tree(binary_file)
+    graph_tree = OpeningTree()
+    graph, root = build_position_graph(original.game, original.get_node_statistics)
+    graph_tree.graph = graph
+    graph_tree.attach_position_graph(graph_tree.game, root, 100)
+
+    for opening_tree in (file_tree, graph_tree):
+        paths = {" ".join(move.uci() for move in path) for path in opening_tree.find_paths(fen)}
+        assert paths == expected
+        # Only the nodes along the paths and their siblings were created
+        assert count_loaded(opening_tree) <= 1 + 4 * 5 * len(paths)
+    file_tree.close_tree_file()
+
+
+def test_graph_shares_transposed_positions():
+    opening_tree, first, second = make_transposed_tree()
+    graph, root = build_position_graph(opening_tree.game, opening_tree.get_node_statistics)
+    # Start, two first moves, one reply to each and the shared position
+    assert len(graph) == 6
+    position = graph.get(first.board().fen())
+    assert position is graph.get(second.board().fen())
+    assert [edge.target for edge in root.edges] == [graph.get(node.board().fen()) for node in opening_tree.game.variations]
+
+
+def test_graph_keeps_the_tree():
+    opening_tree = make_synthetic_tree(3, 3)
+    text = str(opening_tree.game)
+    graph, root = build_position_graph(opening_tree.game, opening_tree.get_node_statistics)
+    assert len(graph) == len(opening_tree.position_index)
+
+    rebuilt = OpeningTree()
+    rebuilt.graph = graph
+    rebuilt.attach_position_graph(rebuilt.game, root, opening_tree.get_node_statistics(opening_tree.game).frequency)
+    assert str(rebuilt.game) == text
+
+
+def test_transpositions_with_different_clocks_are_one_position():
+    opening_tree = OpeningTree()
+    first = add_line(opening_tree.game, ["e2e4", "e7e5", "g1f3", "b8c6"])
+    second = add_line(opening_tree.game, ["g1f3", "b8c6", "e2e4", "e7e5"])
+    assert first.board().fen() != second.board().fen()
+    assert get_position_key(first.board()) == get_position_key(second.board()) == get_fen_key(first.board().fen())
+
+    graph, root = build_position_graph(opening_tree.game, opening_tree.get_node_statistics)
+    assert graph.get(first.board().fen()) is graph.get(second.board().fen())
+    assert len(graph) == 8
+
+
+def test_repetitions_stay_apart():
+    opening_tree = OpeningTree()
+    node = add_line(opening_tree.game, ["g1f3", "g8f6", "f3g1", "f6g8"])
+    assert node.board().epd() == opening_tree.game.board().epd()
+    graph, root = build_position_graph(opening_tree.game, opening_tree.get_node_statistics)
+    assert graph.get(node.board().fen()) is not root
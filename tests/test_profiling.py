@@ -0,0 +1,44 @@
+import logging
+
+from benchmark import FAKE_ENGINE, StubExplorerServer
+from engine import EnginePool
+from explorer import ExplorerClient
+from opening import OpeningTree
+from profiling import BuildProfile
+
+
+class CountingExplorer:
+    def __init__(self, requests):
+        self.requests = requests
+
+    def get_stats(self):
+        return {"requests": self.requests, "throttled": 0, "retries": 0}
+
+
+def test_profile_only_counts_its_own_requests():
+    explorer = CountingExplorer(40)
+    profile = BuildProfile(explorer=explorer)
+    assert profile.explorer is explorer
+    explorer.requests = 45
+    assert profile.to_dict()["counters"]["requests"] == 5
+
+
+def test_refresh_is_profiled_and_logged(caplog):
+    opening_tree = OpeningTree()
+    with StubExplorerServer() as server, ExplorerClient(rate=10 ** 6, burst=10 ** 6, cache=None) as explorer:
+        with EnginePool(engine_path=FAKE_ENGINE, size=2) as engine_pool:
+            opening_tree.build_opening_tree_breadth_first(server.url, min_occurrences=10 ** 5, engine_time=0.01, engine_pool=engine_pool, explorer=explorer)
+            positions = opening_tree.build_profile.counters["nodes_expanded"]
+
+            profile = BuildProfile("Refresh")
+            with caplog.at_level(logging.INFO, logger="opening"):
+                opening_tree.refresh_opening_tree(server.url, min_occurrences=10 ** 5, engine_pool=engine_pool, explorer=explorer, profile=profile)
+
+    # The stub answers the same again, so only the root is queried and nothing below it changed
+    assert opening_tree.build_profile is profile
+    counters = profile.to_dict()["counters"]
+    assert counters["nodes_expanded"] == 1
+    assert counters["unchanged"] == 1
+    assert counters["requests"] == 1
+    assert positions > 1
+    assert any(record.getMessage().startswith("Refresh done") for record in caplog.records)
@@ -0,0 +1,74 @@
+import chess
+
+from benchmark import make_synthetic_tree
+from binary_tree import BINARY_EXTENSION
+from opening import OpeningTree
+
+
+def get_minimax(opening_tree, node, color):
+    # Reference value of the tree with best play for both sides, from the evals of the leaves
+    if not node.variations:
+        return opening_tree.get_repertoire(color).static[opening_tree.get_columns().get_node_index(node)]
+    values = [get_minimax(opening_tree, variation, color) for variation in node.variations]
+    return max(values) if node.turn() == color else min(values)
+
+
+def test_next_in_frequency_mode_is_the_most_common_move():
+    opening_tree = make_synthetic_tree(3, 4)
+    for node, _, _, _ in opening_tree.preorder(opening_tree.game):
+        if node.variations:
+            expected = max(node.variations, key=lambda variation: opening_tree.get_node_statistics(variation).frequency)
+            assert opening_tree.get_most_common_child(node) is expected
+    assert opening_tree.get_most_common_child(opening_tree.game.variations[0].variations[0].variations[0]) is None
+
+
+def test_next_in_engine_mode_is_the_best_move():
+    opening_tree = make_synthetic_tree(3, 4)
+    node = opening_tree.game
+    best_child = opening_tree.get_best_child(node, criterion="minimax")
+    assert get_minimax(opening_tree, best_child, chess.WHITE) == max(get_minimax(opening_tree, variation, chess.WHITE) for variation in node.variations)
+
+
+def test_stale_repertoire_is_reused_until_it_misses_the_node():
+    opening_tree = make_synthetic_tree(2, 3)
+    repertoire = opening_tree.get_repertoire(chess.WHITE)
+    leaf = opening_tree.game.variations[0].variations[0]
+
+    # Without max_age a change always rebuilds, with it the old repertoire is kept for a while
+    opening_tree.invalidate_columns()
+    assert opening_tree.get_repertoire(chess.WHITE, max_age=60) is repertoire
+    assert opening_tree.get_repertoire(chess.WHITE) is not repertoire
+    repertoire = opening_tree.get_repertoire(chess.WHITE)
+
+    # A node added since is not in the old repertoire, so it is rebuilt anyway
+    child_node = leaf.add_variation(next(iter(leaf.board().legal_moves)))
+    opening_tree.invalidate_columns()
+    assert opening_tree.get_repertoire(chess.WHITE, max_age=60, node=leaf) is repertoire
+    rebuilt = opening_tree.get_repertoire(chess.WHITE, max_age=60, node=child_node)
+    assert rebuilt is not repertoire
+    assert rebuilt.get_row(child_node) is not None
+
+
+def test_empty_tree_has_no_next_move():
+    opening_tree = OpeningTree()
+    assert opening_tree.get_most_common_child() is None
+    assert opening_tree.get_best_child() is None
+
+
+def test_next_in_engine_mode_does_not_expand_lazy_trees(tmp_path):
+    binary_file = str(tmp_path / ("synthetic" + BINARY_EXTENSION))
+    make_synthetic_tree(5, 4).save_opening_tree(binary_file)
+    opening_tree = OpeningTree()
+    opening_tree.load_opening_tree(binary_file)
+
+    # Every step reads the children of the new node and nothing else
+    node = opening_tree.game
+    for depth in range(1, 4):
+        node = opening_tree.get_best_child(node)
+        assert node is not None and node.ply() == depth
+        assert sum(1 for _ in opening_tree.preorder(opening_tree.game, loaded_only=True)) <= 1 + 4 * depth
+    # Children read by the display since the last export are valued too
+    children = node.variations
+    repertoire = opening_tree.get_repertoire(node.turn(), node=node, loaded_only=True)
+    assert len(repertoire.get_ordered_children(repertoire.get_row(node))) == len(children)
+    opening_tree.close_tree_file()
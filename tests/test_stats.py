@@ -0,0 +1,50 @@
+from stats import derive_stats, format_comment, parse_comment
+
+COMMENT = "[%eval -0.35,24][open: B20, Sicilian Defense][freq: 1200, 25.5][wdb: 400, 500, 300][wdb%: 33.33, 41.67, 25.0]"
+
+
+def test_parse_and_format_round_trip():
+    stats = parse_comment(COMMENT)
+    assert (stats.eco, stats.openingname, stats.has_opening) == ("B20", "Sicilian Defense", True)
+    assert (stats.total_occurrence, stats.frequency) == (1200, 25.5)
+    assert (stats.white_wins, stats.draws, stats.black_wins) == (400, 500, 300)
+    assert (stats.eval, stats.evaldepth, stats.mate) == (-0.35, 24, None)
+    assert format_comment(stats) == COMMENT
+
+
+def test_mates_survive_a_round_trip_but_are_not_an_eval():
+    comment = "[%eval #-3,30][freq: 10, 50.0][wdb: 4, 3, 3][wdb%: 40.0, 30.0, 30.0]"
+    stats = parse_comment(comment)
+    assert (stats.mate, stats.evaldepth, stats.eval) == (-3, 30, None)
+    assert stats.to_dict()["eval"] == "?"
+    assert format_comment(stats) == comment
+
+
+def test_opening_is_inherited_but_not_written():
+    parent_stats = parse_comment(COMMENT)
+    stats = parse_comment("[freq: 600, 50.0][wdb: 200, 250, 150][wdb%: 33.33, 41.67, 25.0]", parent_stats)
+    assert (stats.eco, stats.openingname, stats.has_opening) == ("B20", "Sicilian Defense", False)
+    assert "[open:" not in format_comment(stats)
+
+
+def test_empty_comment():
+    stats = parse_comment("")
+    assert stats.total_occurrence == 0 and stats.eval is None
+    assert format_comment(stats) == ""
+
+
+def test_derived_stats_belong_to_their_path():
+    position_stats = parse_comment("[%eval 0.10,20][freq: 600, 50.0][wdb: 200, 250, 150][wdb%: 33.33, 41.67, 25.0]")
+    parent_stats = parse_comment(COMMENT)
+    stats = derive_stats(position_stats, 12.5, parent_stats)
+    assert stats.frequency == 12.5 and stats.eco == "B20"
+    assert position_stats.frequency == 50.0 and position_stats.eco == ""
+    assert derive_stats(position_stats, 12.5).eco == ""
+
+
+def test_only_the_root_frequency_is_a_whole_number():
+    stats = parse_comment("[freq: 10, 100][wdb: 4, 3, 3][wdb%: 40.0, 30.0, 30.0]")
+    assert stats.frequency == 100.0
+    assert format_comment(stats, root=True) == "[freq: 10, 100][wdb: 4, 3, 3][wdb%: 40.0, 30.0, 30.0]"
+    assert format_comment(stats) == "[freq: 10, 100.0][wdb: 4, 3, 3][wdb%: 40.0, 30.0, 30.0]"
+    assert format_comment(derive_stats(stats, 99.5), root=True).startswith("[freq: 10, 99.5]")
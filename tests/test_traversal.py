@@ -0,0 +1,63 @@
+import chess
+
+from opening import OpeningTree
+
+
+def make_tree():
+    # 1. e4 e5, 1. e4 c5 2. Nf3 and 1. d4 d5
+    opening_tree = OpeningTree()
+    for line in (["e2e4", "e7e5"], ["e2e4", "c7c5", "g1f3"], ["d2d4", "d7d5"]):
+        node = opening_tree.game
+        for uci in line:
+            move = chess.Move.from_uci(uci)
+            node = node.variation(move) if node.has_variation(move) else node.add_variation(move)
+    return opening_tree
+
+
+def get_sans(items):
+    return [node.san() if node.move else "start" for node, _, _, _ in items]
+
+
+def test_size_histograms():
+    opening_tree = make_tree()
+    size = opening_tree.get_size(opening_tree.game)
+    assert size["depth_counts"] == {0: 1, 1: 2, 2: 3, 3: 1}
+    assert size["breadth_histogram"] == {0: 3, 1: 2, 2: 2}
+    assert (size["nodes_amount"], size["total_breadth"], size["total_depth"]) == (7, 6, 11)
+    assert (size["min_breadth"], size["max_breadth"], size["min_depth"], size["max_depth"]) == (0, 2, 0, 3)
+    assert size["avg_depth"] == 11 / 7
+
+    # Depths count from the given node
+    size = opening_tree.get_size(opening_tree.game.variations[0])
+    assert size["depth_counts"] == {0: 1, 1: 2, 2: 1}
+
+
+def test_traversal_orders_and_depths():
+    opening_tree = make_tree()
+    assert get_sans(opening_tree.preorder(opening_tree.game)) == ["start", "e4", "e5", "c5", "Nf3", "d4", "d5"]
+    assert get_sans(opening_tree.breadth_first(opening_tree.game)) == ["start", "e4", "d4", "e5", "c5", "d5", "Nf3"]
+    assert [depth for _, depth, _, _ in opening_tree.breadth_first(opening_tree.game)] == [0, 1, 1, 2, 2, 2, 3]
+    assert get_sans(opening_tree.preorder(opening_tree.game, max_depth=1)) == ["start", "e4", "d4"]
+
+
+def test_paths_and_parent_statistics():
+    opening_tree = make_tree()
+    for node, depth, parent_stats, path in opening_tree.preorder(opening_tree.game, paths=True):
+        assert list(path) == node.board().move_stack
+        assert parent_stats is (opening_tree.get_node_statistics(node.parent) if depth else None)
+    # Without paths none are built
+    assert {path for _, _, _, path in opening_tree.preorder(opening_tree.game)} == {None}
+
+
+def test_prune_skips_the_children_of_the_pruned_node():
+    opening_tree = make_tree()
+    asked = []
+
+    def prune(node, depth):
+        asked.append(node)
+        return node.move == chess.Move.from_uci("e2e4")
+
+    # The pruned node itself is yielded, its subtree is not
+    assert get_sans(opening_tree.preorder(opening_tree.game, prune=prune)) == ["start", "e4", "d4", "d5"]
+    assert len(asked) == 4
+    assert get_sans(opening_tree.breadth_first(opening_tree.game, prune=lambda node, depth: depth == 1)) == ["start", "e4", "d4"]